@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from dxlib import TradeType
+
+COLUMNS = ["security", "trade_type", "quantity", "price", "timestamp"]
+SIDES = {TradeType.BUY: 1, TradeType.SELL: -1}
+# Headers of the ledger file, as the backtest has always written it
+LEDGER_HEADERS = {"security": "Security", "trade_type": "Trade Type", "quantity": "Quantity", "price": "Price",
+                  "timestamp": "Date"}
+
+
+def ledger(transactions) -> pd.DataFrame:
+    """Loads transactions into columns once, everything else works on the columns.
+
+    Adds `side` (1 to buy, -1 to sell, 0 otherwise) and `date`, the timestamp or NaT for undated transactions
+    (timestamp -1).
+    """
+    df = pd.DataFrame.from_records(
+        [(t.security, t.trade_type, t.quantity, t.price, t.timestamp) for t in transactions], columns=COLUMNS)
+
+    types = pd.unique(df["trade_type"])
+    df["side"] = df["trade_type"].map({trade_type: SIDES.get(trade_type, 0) for trade_type in types}).astype(np.int8)
+    timestamps = df["timestamp"]
+    df["date"] = pd.to_datetime(timestamps.where(timestamps.ne(-1)), errors="coerce")
+    return df
+
+
+def _securities(df: pd.DataFrame, exclude=()) -> pd.DataFrame:
+    return df[~df["security"].isin(list(exclude))] if len(exclude) else df
+
+
+def last_prices(close: pd.DataFrame) -> pd.Series:
+    """Last valid price of every column, NaN for columns that have none."""
+    values = close.to_numpy(dtype=float)
+    if not len(values):
+        return pd.Series(np.nan, index=close.columns, dtype=float)
+    valid = ~np.isnan(values)
+    last = len(values) - 1 - np.argmax(valid[::-1], axis=0)
+    prices = values[last, np.arange(values.shape[1])]
+    return pd.Series(np.where(valid.any(axis=0), prices, np.nan), index=close.columns)
+
+
+def mark_to_market(position: pd.Series, prices: pd.Series, haircut=.98, fee=2) -> float:
+    """Value of a position sold at the last prices, less a haircut on the price and a fixed fee per security."""
+    return (position * (prices.reindex(position.index) * haircut - fee)).sum()
+
+
+def round_trips(df: pd.DataFrame, prices: pd.Series = None, exclude=()) -> pd.DataFrame:
+    """Profit or loss of every round trip, from a flat position in a security back to a flat position.
+
+    Trips still open at the end are marked to market with `prices` when given, and flagged `open`.
+    """
+    trades = _securities(df, exclude)
+    codes, securities = pd.factorize(trades["security"])
+    # stable, so transactions of a security keep their order
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    side = trades["side"].to_numpy()[order]
+    quantity = trades["quantity"].to_numpy(dtype=float)[order]
+    price = trades["price"].to_numpy(dtype=float)[order]
+    # buys without a price are counted at 1, as the backtest always did
+    price = np.where((side > 0) & ((price == 0) | np.isnan(price)), 1, price)
+
+    signed = side * quantity
+    grouped = pd.Series(signed).groupby(codes)
+    position = grouped.cumsum().to_numpy()
+    flat = position == 0
+    # a trip counts the trips closed before it within its security
+    trip = pd.Series(flat.astype(np.int64)).groupby(codes).cumsum().to_numpy() - flat
+
+    frame = pd.DataFrame({
+        "code": codes,
+        "trip": trip,
+        "cash_flow": -signed * price,
+        "bought": np.where(side > 0, quantity, 0),
+        "position": position,
+        "opened": trades["date"].to_numpy()[order],
+    })
+    trips = frame.groupby(["code", "trip"], sort=False).agg(
+        pnl=("cash_flow", "sum"),
+        quantity=("bought", "sum"),
+        position=("position", "last"),
+        opened=("opened", "first"),
+        closed=("opened", "last"),
+        transactions=("cash_flow", "size"),
+    ).reset_index()
+
+    trips["open"] = trips["position"] != 0
+    trips.loc[trips["open"], "closed"] = pd.NaT
+    if prices is not None:
+        value = trips["position"] * prices.reindex(securities).to_numpy()[trips["code"].to_numpy()]
+        trips["pnl"] = trips["pnl"] + np.where(trips["open"], value, 0)
+    trips.insert(0, "security", securities[trips["code"].to_numpy()])
+    return trips.drop(columns=["code", "trip"])
+
+
+def trade_stats(trips: pd.DataFrame) -> dict:
+    """Win and loss counts, rates and averages over the closed round trips, overall and by security."""
+    closed = trips[~trips["open"]]
+    pnl = closed["pnl"]
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+
+    by_security = pd.DataFrame({
+        "security": closed["security"],
+        "wins": pnl > 0,
+        "losses": pnl < 0,
+        "pnl": pnl,
+    }).groupby("security", sort=False).agg(
+        trips=("pnl", "size"),
+        wins=("wins", "sum"),
+        losses=("losses", "sum"),
+        pnl=("pnl", "sum"),
+    )
+
+    return {
+        "trips": len(closed),
+        "open": int(trips["open"].sum()),
+        "wins": len(wins),
+        "losses": len(losses),
+        "win_rate": len(wins) / len(closed) if len(closed) else np.nan,
+        "average_win": wins.mean(),
+        "average_loss": losses.mean(),
+        "profit_factor": wins.sum() / -losses.sum() if len(losses) else np.nan,
+        "pnl": pnl.sum(),
+        "by_security": by_security,
+    }
+
+
+def trades_per_period(df: pd.DataFrame, freq: str = "M", exclude=()) -> pd.Series:
+    """Number of dated transactions in each period that had any."""
+    trades = _securities(df, exclude)
+    dates = trades["date"].dropna()
+    return dates.groupby(dates.dt.to_period(freq)).size()
+
+
+def drawdown(values: pd.Series | pd.DataFrame) -> pd.Series | pd.DataFrame:
+    """Relative distance to the running peak, in percent (0 at a peak, negative below it)."""
+    return (values / values.cummax() - 1).fillna(0) * 100
+
+
+def _format(column: pd.Series) -> pd.Series:
+    return column.map({value: str(value) for value in pd.unique(column)})
+
+
+def write_ledger(df: pd.DataFrame, path: str):
+    """Writes the ledger in one go, as parquet for `.parquet` paths (needs pyarrow) and CSV otherwise."""
+    out = df[COLUMNS].copy()
+    # formatted once per distinct value rather than once per row
+    out["trade_type"] = _format(out["trade_type"])
+    if path.endswith(".parquet"):
+        out["security"] = _format(out["security"])
+        out.to_parquet(path, index=False)
+    else:
+        out.rename(columns=LEDGER_HEADERS).to_csv(path, index=False)
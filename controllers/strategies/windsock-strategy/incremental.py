@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from indicators import NUM_STD, VOLATILITY_WINDOW
+
+
+class Welford:
+    """Expanding mean and sample variance, one row at a time, skipping values that aren't finite."""
+
+    def __init__(self, size):
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def push(self, values):
+        finite = np.isfinite(values)
+        self.count += finite
+        delta = np.where(finite, values - self.mean, 0)
+        self.mean += np.where(finite, delta / np.maximum(self.count, 1), 0)
+        self.m2 += np.where(finite, delta * (values - self.mean), 0)
+
+    def std(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # NaN until there are two values, as pandas
+            std = np.sqrt(self.m2 / (self.count - 1))
+        return np.where(self.count > 1, std, np.nan)
+
+
+class WindsockIndicators:
+    """Rolling state of the windsock ADTV, momentum and breakout indicators, updated one bar at a time.
+
+    Replaces recomputing `WindsockTradingStrategy.adtv`, `momentum` and `breakout` over the whole history on every bar:
+    each new bar costs O(long_window) for the volume averages, O(short_window) for the momentum product and the
+    Bollinger band, and O(VOLATILITY_WINDOW) for the volatility. The indicators agree with the pandas definitions up to
+    floating point rounding, and feeding the same bars gives the same floats whether they come one at a time or at once.
+    """
+
+    def __init__(self, short_window=14, long_window=60):
+        self.short_window = short_window
+        self.long_window = long_window
+        self.columns = None
+        self.reset()
+
+    def reset(self, columns=None):
+        self.columns = columns
+        self.rows = 0
+        self.last_index = None
+        size = len(columns) if columns is not None else 0
+
+        # last long_window volumes, a ring buffer indexed by row modulo long_window
+        self.volumes = np.full((self.long_window, size), np.nan)
+        self.relative_adtv = np.full(size, np.nan)
+
+        # expanding mean and variance of the ADTV changes, infinities summed apart like pandas would
+        self.changes_stats = Welford(size)
+        self.infinite = np.zeros(size)
+
+        # last short_window + 1 forward filled changes, from which the momentum window is renormalized
+        self.changes = np.full((self.short_window + 1, size), np.nan)
+        self.filled_change = np.full(size, np.nan)
+        self.change = np.full(size, np.nan)
+
+        # last short_window closes for the Bollinger band, and the expanding statistics of its width
+        self.closes = np.full((self.short_window, size), np.nan)
+        self.width = np.full(size, np.nan)
+        self.width_stats = Welford(size)
+
+        # last VOLATILITY_WINDOW percent changes of the forward filled close
+        self.last_close = np.full(size, np.nan)
+        self.returns = np.full((VOLATILITY_WINDOW, size), np.nan)
+        self.volatility = np.full(size, np.nan)
+
+    def _consumed(self, df: pd.DataFrame, columns) -> bool:
+        # the history only grows between calls of a backtest, anything else is a new run
+        if self.columns is None or not self.columns.equals(columns):
+            return False
+        if self.rows > len(df) or (self.rows and df.index[self.rows - 1] != self.last_index):
+            return False
+        return True
+
+    def update(self, history) -> tuple[pd.Series, pd.Series, pd.Series]:
+        """Consumes the bars added to `history` since the last call and returns the last ADTV, momentum and
+        breakout rows."""
+        volume = history.df["Volume"]
+        if not self._consumed(history.df, volume.columns):
+            self.reset(volume.columns)
+
+        close = history.df["Close"].reindex(columns=self.columns)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for volume_row, close_row in zip(volume.iloc[self.rows:].to_numpy(dtype=float),
+                                             close.iloc[self.rows:].to_numpy(dtype=float)):
+                self._push(volume_row, close_row)
+        self.rows = len(history.df)
+        self.last_index = history.df.index[-1] if self.rows else None
+
+        return (pd.Series(self.adtv(), index=self.columns), pd.Series(self.momentum(), index=self.columns),
+                pd.Series(self.breakout(), index=self.columns))
+
+    def _window(self, buffer, length, rows):
+        # chronological view of the last `length` rows of a ring buffer, or None if there aren't enough yet
+        if rows < length:
+            return None
+        capacity = len(buffer)
+        return buffer[np.arange(rows - length, rows) % capacity]
+
+    def _push(self, volume, close):
+        self.volumes[self.rows % self.long_window] = volume
+        self.closes[self.rows % self.short_window] = close
+        self.rows += 1
+
+        # rolling means are NaN until the window is full, or while it holds a NaN, as with pandas
+        short = self._window(self.volumes, self.short_window, self.rows)
+        long = self._window(self.volumes, self.long_window, self.rows)
+        short_mean = short.sum(axis=0) / self.short_window if short is not None else np.nan
+        long_mean = long.sum(axis=0) / self.long_window if long is not None else np.nan
+        relative_adtv = short_mean / long_mean
+
+        # pct_change pads missing values with the last valid one
+        filled = np.where(np.isnan(relative_adtv), self.relative_adtv, relative_adtv)
+        change = filled / self.relative_adtv - 1
+        self.relative_adtv = filled
+        self.change = change
+
+        self.infinite += np.where(np.isinf(change), change, 0)
+        self.changes_stats.push(change)
+
+        self.filled_change = np.where(np.isnan(change), self.filled_change, change)
+        self.changes[(self.rows - 1) % len(self.changes)] = self.filled_change
+
+        # the band is as wide as 2 * NUM_STD rolling standard deviations of the close
+        if (closes := self._window(self.closes, self.short_window, self.rows)) is not None:
+            mean = closes.mean(axis=0)
+            std = closes.std(axis=0, ddof=1)
+            self.width = (mean + NUM_STD * std) - (mean - NUM_STD * std)
+        self.width_stats.push(self.width)
+
+        filled_close = np.where(np.isnan(close), self.last_close, close)
+        self.returns[(self.rows - 1) % VOLATILITY_WINDOW] = filled_close / self.last_close - 1
+        self.last_close = filled_close
+        if (returns := self._window(self.returns, VOLATILITY_WINDOW, self.rows)) is not None:
+            self.volatility = returns.std(axis=0, ddof=1)
+
+    def _statistics(self):
+        stats = self.changes_stats
+        count = stats.count + (self.infinite != 0)
+        mean = np.where(self.infinite != 0, self.infinite, stats.mean)
+        mean = np.where(count > 0, mean, np.nan)
+        std = np.where(self.infinite == 0, stats.std(), np.nan)
+        # as `change.std().fillna(1)`
+        return mean, np.where(np.isnan(std), 1, std)
+
+    def adtv(self) -> np.ndarray:
+        mean, std = self._statistics()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (self.change - mean) / std
+
+    def momentum(self) -> np.ndarray:
+        window = self._window(self.changes, self.short_window + 1, self.rows)
+        if window is None:
+            return np.full(len(self.columns), np.nan)
+        mean, std = self._statistics()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # earlier values are normalized with the statistics of the whole history, as the full computation does
+            adtv = (window - mean) / std
+            factors = 1 + (adtv[1:] / adtv[:-1] - 1)
+            momentum = np.prod(factors, axis=0) - 1
+        # rolling windows holding a NaN or an infinity have no value
+        return np.where(~np.isfinite(factors).all(axis=0), np.nan, momentum)
+
+    def breakout(self) -> np.ndarray:
+        # whether the volatility lies further from the average band width than the current width does
+        mean = np.where(self.width_stats.count > 0, self.width_stats.mean, np.nan)
+        std = self.width_stats.std() + 1e-6
+        with np.errstate(divide="ignore", invalid="ignore"):
+            volatility = np.abs((self.volatility - mean) / std)
+            width = np.abs((self.width - mean) / std)
+        # NaN compares as False
+        return volatility > width
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+METHODS = ("kernel", "log")
+# defaults of the dxlib Bollinger bands and volatility
+NUM_STD = 2
+VOLATILITY_WINDOW = 21
+
+
+def _wrap(result: np.ndarray, like):
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(result, index=like.index, columns=like.columns)
+    if isinstance(like, pd.Series):
+        return pd.Series(result, index=like.index, name=like.name)
+    return result
+
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    # sum over the trailing window of every row from cumulative sums, the first window - 1 rows have none
+    cumulative = np.cumsum(values, axis=0)
+    sums = cumulative[window - 1:].copy()
+    sums[1:] -= cumulative[:-window]
+    return sums
+
+
+def _kernel_product(values: np.ndarray, window: int) -> np.ndarray:
+    # the product of each window in C, in the same order as calling np.prod on it
+    return np.prod(sliding_window_view(values, window, axis=0), axis=-1)
+
+
+def _log_product(values: np.ndarray, window: int) -> np.ndarray:
+    zero = values == 0
+    negative = values < 0
+    usable = np.isfinite(values) & ~zero
+
+    # magnitudes add up in log space, signs and zeros are counted apart
+    magnitude = np.exp(_window_sum(np.log(np.abs(np.where(usable, values, 1))), window))
+    sign = np.where(_window_sum(negative.astype(np.int64), window) % 2, -1.0, 1.0)
+    zeros = _window_sum(zero.astype(np.int64), window) > 0
+    return sign * np.where(zeros, 0.0, magnitude)
+
+
+def rolling_product(values, window: int, method: str = "kernel"):
+    """Product of every trailing window of `window` rows, over each column at once.
+
+    Same values as `values.rolling(window).apply(np.prod, raw=True)`: NaN for the first window - 1 rows and for windows
+    holding a NaN or an infinity. The `kernel` method multiplies each window in C and gives exactly the same floats,
+    in O(rows * window); the `log` method sums the logarithms of the magnitudes in O(rows) whatever the window, exact
+    up to rounding.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+    if window < 1:
+        raise ValueError("window must be at least 1")
+
+    array = np.asarray(values, dtype=float)
+    result = np.full(array.shape, np.nan)
+    if len(array) >= window:
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            if method == "kernel":
+                product = _kernel_product(array, window)
+            else:
+                product = _log_product(array, window)
+        # pandas counts infinities as missing observations too
+        missing = _window_sum((~np.isfinite(array)).astype(np.int64), window) > 0
+        result[window - 1:] = np.where(missing, np.nan, product)
+    return _wrap(result, values)
+
+
+def compounded_return(change, window: int, method: str = "kernel"):
+    """Return compounded over every trailing window of `window` periods, from per-period relative changes."""
+    return rolling_product(1 + change, window, method) - 1
+
+
+def momentum(value, window: int, method: str = "kernel"):
+    """Compounded percent change of `value` over the trailing `window` periods."""
+    return compounded_return(value.pct_change(), window, method)
+
+
+def bollinger_bands(close, window: int, num_std: float = NUM_STD):
+    """Upper and lower bands `num_std` rolling standard deviations around the rolling mean, as dxlib defines them."""
+    mean = close.rolling(window).mean()
+    std = close.rolling(window).std()
+    return mean + num_std * std, mean - num_std * std
+
+
+def volatility(close, window: int = VOLATILITY_WINDOW):
+    """Rolling standard deviation of the percent changes, as dxlib defines it."""
+    return close.pct_change().rolling(window).std()
@@ -3,6 +3,18 @@ import pandas as pd
 
 from dxlib import Strategy, History, Signal, TradeType
 
+import indicators
+from incremental import WindsockIndicators
+
+# One row per security: side is 1 to buy, -1 to sell and 0 to wait
+SIGNAL_DTYPE = np.dtype([("side", np.int8), ("quantity", np.int64), ("price", np.float64)])
+SIDES = {1: TradeType.BUY, -1: TradeType.SELL}
+
+# Position thresholds (exclusive) and the sell and buy bounds they allow, checked from the top
+POSITION_TIERS = np.array([150, 100, 50, 1])
+SELL_TIERS = np.array([50, 25, 10, 1])
+BUY_TIERS = np.array([200, 100, 50, 50])
+
 
 class WindsockAllocationStrategy:
     def __init__(self, predictor=None):
@@ -18,44 +30,53 @@ class WindsockAllocationStrategy:
     def execute(self, idx, position: pd.Series, history: History) -> tuple[pd.Series, pd.Series]:
         # Define the lower and upper bounds for buy and sell quantities
         # For example, [(5, 10)] means no more than 5 can be sold, and no more than 10 can be bought of the security.
-        buy = pd.Series(50, index=history.securities.values())
-        sell = pd.Series(0, index=history.securities.values())
-
-        for security in position.index:
-            if position[security] > 150:
-                sell[security] = 50
-                buy[security] = 200
-            elif position[security] > 100:
-                sell[security] = 25
-                buy[security] = 100
-            elif position[security] > 50:
-                sell[security] = 10
-                buy[security] = 50
-            elif position[security] > 1:
-                sell[security] = 1
+        securities = pd.Index(list(history.securities.values()))
+        sell, buy = self.quantities(position.reindex(securities).fillna(0).to_numpy(dtype=float))
 
+        return pd.Series(sell, index=securities), pd.Series(buy, index=securities)
+
+    @classmethod
+    def quantities(cls, position: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # np.select picks the first tier whose threshold is exceeded, like an if/elif chain
+        conditions = [position > threshold for threshold in POSITION_TIERS]
+        sell = np.select(conditions, SELL_TIERS, default=0)
+        buy = np.select(conditions, BUY_TIERS, default=50)
         return sell, buy
 
 
 class WindsockTradingStrategy(Strategy):
-    def __init__(self, short_window=14, long_window=60, liquidity_threshold=.9, growth_threshold=.4):
+    def __init__(self, short_window=14, long_window=60, liquidity_threshold=.9, growth_threshold=.4,
+                 incremental=False):
         super().__init__()
         self.short_window = short_window
         self.long_window = long_window
         self.liquidity_threshold = liquidity_threshold
         self.growth_threshold = growth_threshold
         self.allocation_strategy = WindsockAllocationStrategy()
+        # Keep the indicators as rolling state between bars instead of replaying the whole history on each bar
+        self.incremental = incremental
+        self.indicators = WindsockIndicators(short_window, long_window)
 
     def execute(self, idx, position: pd.Series, history: History) -> pd.Series:
         loc = history.df.index.get_loc(idx)
+        securities = pd.Index(list(history.securities.values()))
 
         if loc >= self.long_window:
-            signals = self.get_signals(history)
-            quantities = self.allocation_strategy.execute(idx, position, history)
+            signals = self.signal_array(history)
+            position = position.reindex(securities).fillna(0).to_numpy(dtype=float)
+            quantities = self.allocation_strategy.quantities(position)
 
-            return self.set_quantity(signals, quantities)
+            return self.to_signals(self.size(signals, quantities), securities)
         else:
-            return pd.Series(Signal(TradeType.WAIT), index=history.securities.values())
+            return pd.Series(Signal(TradeType.WAIT), index=securities)
+
+    @classmethod
+    def size(cls, signals: np.ndarray, quantities: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        sell_quantities, buy_quantities = quantities
+
+        signals["quantity"] = np.where(signals["side"] == 1, buy_quantities,
+                                       np.where(signals["side"] == -1, sell_quantities, signals["quantity"]))
+        return signals
 
     @classmethod
     def set_quantity(cls, signals: pd.Series, quantities: tuple[pd.Series, pd.Series]):
@@ -69,24 +90,37 @@ class WindsockTradingStrategy(Strategy):
 
         return signals
 
-    def get_signals(self, history):
-        np.seterr(divide='ignore')
-        adtv = self.adtv(history)
-        breakout = self.breakout(history)
-
-        momentum = self.momentum(adtv).iloc[-1]
-
-        signals = pd.Series(Signal(TradeType.WAIT), index=history.securities.values())
-        prices = history.df["Close"].iloc[-1]
-
-        for security in history.securities.values():
-            if breakout[security] and adtv[security].iloc[-1] > self.liquidity_threshold:
-                if momentum[security] > self.growth_threshold:
-                    signals[security] = Signal(TradeType.BUY, quantity=1, price=prices[security])
-                elif momentum[security] < -self.growth_threshold:
-                    signals[security] = Signal(TradeType.SELL, quantity=1, price=prices[security])
-        np.seterr(divide='warn')
+    @classmethod
+    def to_signals(cls, signals: np.ndarray, securities: pd.Index) -> pd.Series:
+        # Signal objects are only built here, for the securities that trade
+        result = pd.Series(Signal(TradeType.WAIT), index=securities)
+        for i in np.flatnonzero(signals["side"]):
+            side, quantity, price = signals[i].item()
+            result.iat[i] = Signal(SIDES[side], quantity=quantity, price=price)
+        return result
 
+    def get_signals(self, history):
+        return self.to_signals(self.signal_array(history), pd.Index(list(history.securities.values())))
+
+    def signal_array(self, history) -> np.ndarray:
+        securities = pd.Index(list(history.securities.values()))
+        # both ways run the same arithmetic, so they give the same signals
+        state = self.indicators if self.incremental else WindsockIndicators(self.short_window, self.long_window)
+        adtv, momentum, breakout = state.update(history)
+
+        breakout = breakout.reindex(securities).fillna(False).to_numpy(dtype=bool)
+        adtv = adtv.reindex(securities).to_numpy(dtype=float)
+        momentum = momentum.reindex(securities).to_numpy(dtype=float)
+
+        # NaN compares as False, so securities missing an indicator wait
+        active = breakout & (adtv > self.liquidity_threshold)
+        buy = active & (momentum > self.growth_threshold)
+        sell = active & ~buy & (momentum < -self.growth_threshold)
+
+        signals = np.zeros(len(securities), dtype=SIGNAL_DTYPE)
+        signals["side"] = np.where(buy, 1, np.where(sell, -1, 0))
+        signals["quantity"] = np.where(buy | sell, 1, 0)
+        signals["price"] = history.df["Close"].iloc[-1].reindex(securities).to_numpy(dtype=float)
         return signals
 
     def atr(self, history):
@@ -99,6 +133,9 @@ class WindsockTradingStrategy(Strategy):
 
         return atr
 
+    # adtv, momentum and breakout define the indicators over the whole history, which WindsockIndicators follows bar by
+    # bar up to rounding
+
     def adtv(self, history):
         volume = history.df["Volume"]
 
@@ -111,16 +148,12 @@ class WindsockTradingStrategy(Strategy):
         return (change - mean) / std
 
     def momentum(self, value):
-        change = value.pct_change()
-        momentum = (1 + change).rolling(window=self.short_window).apply(np.prod, raw=True) - 1
-        return momentum
+        return indicators.momentum(value, self.short_window)
 
     def breakout(self, history) -> pd.Series:
-        volatility = history.indicators.volatility()
-        upper, lower = history.indicators.bollinger_bands(self.short_window)
-        upper = upper["Close"]
-        lower = lower["Close"]
-        volatility = volatility["Close"]
+        close = history.df["Close"]
+        upper, lower = indicators.bollinger_bands(close, self.short_window)
+        volatility = indicators.volatility(close)
         var_mean = (upper - lower).mean()
         var_var = (upper - lower).std() + 1e-6
 
@@ -0,0 +1,199 @@
+import csv
+import io
+import itertools
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import dxlib as dx
+from dxlib import StrategyManager
+
+import analytics
+from strategy import WindsockTradingStrategy
+
+PARAMETERS = ("short_window", "long_window", "liquidity_threshold", "growth_threshold")
+INTEGER_PARAMETERS = ("short_window", "long_window")
+METRICS = ("total_return", "max_drawdown", "transactions", "round_trips", "win_rate", "duration", "error")
+
+# The panel of the worker process, attached once by the pool initializer
+_panel: pd.DataFrame | None = None
+
+
+def save_panel(df: pd.DataFrame, path: str):
+    """Writes the price panel to a memory mapped .npy file, with its index and columns next to it."""
+    values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=df.shape)
+    values[:] = df.to_numpy(dtype=float)
+    values.flush()
+    with open(path + ".meta", "wb") as f:
+        pickle.dump((df.index, df.columns), f)
+
+
+def load_panel(path: str) -> pd.DataFrame:
+    """The panel backed by the memory mapped file, read only.
+
+    Nothing is copied: every process reading the file shares the same pages of the OS cache.
+    """
+    values = np.load(path, mmap_mode="r")
+    with open(path + ".meta", "rb") as f:
+        index, columns = pickle.load(f)
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def grid(**values) -> list[dict]:
+    """Every combination of the given parameter values."""
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def random_search(n: int, seed=None, **ranges) -> list[dict]:
+    """`n` parameter sets drawn at random: uniformly within a (low, high) tuple, or among the values of a list."""
+    rng = np.random.default_rng(seed)
+    draws = {}
+    for name, values in ranges.items():
+        if isinstance(values, tuple):
+            low, high = values
+            if name in INTEGER_PARAMETERS:
+                draws[name] = rng.integers(low, high, size=n, endpoint=True)
+            else:
+                draws[name] = rng.uniform(low, high, size=n)
+        else:
+            draws[name] = rng.choice(values, size=n)
+    return [{name: draws[name][i].item() for name in ranges} for i in range(n)]
+
+
+def valid(params: dict) -> bool:
+    return params.get("short_window", 14) < params.get("long_window", 60)
+
+
+def key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+def _attach(path: str):
+    global _panel
+    _panel = load_panel(path)
+
+
+def backtest(history, params: dict, starting_cash=1_000_000) -> dict:
+    manager = StrategyManager(WindsockTradingStrategy(**params, incremental=True), logger=dx.no_logger())
+    portfolio = dx.Portfolio(name="windsock")
+    portfolio.add_cash(starting_cash)
+    manager.register_portfolio(portfolio)
+    manager.run(history)
+
+    cash = portfolio.security_manager.cash
+    prices = analytics.last_prices(history.df["Close"])
+    total_value = analytics.mark_to_market(pd.Series(portfolio.position, dtype=float), prices) + portfolio.current_cash
+
+    holdings = (history.df["Close"] * portfolio.historical_quantity(history).drop(cash, axis=1)).sum(axis=1)
+    ledger = analytics.ledger(portfolio.transaction_history)
+    stats = analytics.trade_stats(analytics.round_trips(ledger, prices, exclude=[cash]))
+
+    return {
+        "total_return": total_value / starting_cash - 1,
+        "max_drawdown": analytics.drawdown(holdings).min(),
+        "transactions": int((~ledger["security"].isin([cash])).sum()),
+        "round_trips": stats["trips"],
+        "win_rate": stats["win_rate"],
+    }
+
+
+def _run(params: dict, starting_cash) -> dict:
+    start = time.perf_counter()
+    try:
+        result = backtest(dx.History(_panel), params, starting_cash)
+    except Exception as e:
+        # on one line, a row of the results is a line of the file
+        result = {"error": " ".join(f"{type(e).__name__}: {e}".split())}
+    result["duration"] = time.perf_counter() - start
+    return result
+
+
+class Sweep:
+    """Runs the windsock backtest for many parameter sets over a process pool.
+
+    Workers attach to the memory mapped price panel instead of receiving a copy, so memory doesn't grow with the
+    number of workers. Each result is appended to `results_path` as soon as it arrives: running the same sweep again
+    only runs the parameter sets that have no successful result yet.
+    """
+
+    def __init__(self, panel_path: str, results_path: str, workers: int = None, starting_cash=1_000_000):
+        self.panel_path = panel_path
+        self.results_path = results_path
+        self.workers = workers
+        self.starting_cash = starting_cash
+
+    def _rows(self) -> str:
+        # the complete lines of the results, a row cut short by an interrupted sweep is left out
+        if not os.path.exists(self.results_path):
+            return ""
+        with open(self.results_path, newline="") as f:
+            text = f.read()
+        return text[:text.rfind("\n") + 1]
+
+    def results(self) -> pd.DataFrame:
+        rows = self._rows()
+        if not rows:
+            return pd.DataFrame(columns=["key", *PARAMETERS, *METRICS])
+        # the latest result of a parameter set wins
+        results = pd.read_csv(io.StringIO(rows))
+        return results.drop_duplicates("key", keep="last").reset_index(drop=True)
+
+    def completed(self) -> set:
+        results = self.results()
+        return set(results.loc[results["error"].isna(), "key"])
+
+    def run(self, parameter_sets: list[dict]) -> pd.DataFrame:
+        completed = self.completed()
+        pending = {}
+        for params in parameter_sets:
+            if valid(params) and (params_key := key(params)) not in completed:
+                pending[params_key] = params
+        if not pending:
+            return self.results()
+
+        rows = self._rows()
+        with open(self.results_path, "w" if not rows else "r+", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["key", *PARAMETERS, *METRICS], extrasaction="ignore")
+            if rows:
+                f.seek(len(rows.encode()))
+                f.truncate()
+            else:
+                writer.writeheader()
+
+            with ProcessPoolExecutor(self.workers, initializer=_attach, initargs=(self.panel_path,)) as pool:
+                futures = {pool.submit(_run, params, self.starting_cash): params_key
+                           for params_key, params in pending.items()}
+                for future in as_completed(futures):
+                    params_key = futures[future]
+                    writer.writerow({"key": params_key, **pending[params_key], **future.result()})
+                    # checkpoint, an interrupted sweep keeps every finished result
+                    f.flush()
+
+        return self.results()
+
+
+def main():
+    panel_path = "panel.npy"
+    if not os.path.exists(panel_path):
+        # plotly and the download are only needed to build the panel once
+        from run import load_bars
+        save_panel(dx.History(load_bars()).df, panel_path)
+
+    sweep = Sweep(panel_path, "sweep.csv")
+    results = sweep.run(grid(
+        short_window=[7, 14, 21],
+        long_window=[30, 60, 90],
+        liquidity_threshold=[.5, .9, 1.3],
+        growth_threshold=[.2, .4, .6],
+    ))
+    print(results.sort_values("total_return", ascending=False).head(10))
+
+
+if __name__ == "__main__":
+    main()
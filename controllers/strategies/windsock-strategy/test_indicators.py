@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+
+
+@pytest.fixture
+def values() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.uniform(-2, 2, (200, 5)), columns=list("abcde"))
+    df.iloc[20:23, 0] = np.nan
+    df.iloc[40, 1] = 0
+    df.iloc[60:70, 1] = 0
+    df.iloc[80, 2] = np.inf
+    df.iloc[90, 2] = -np.inf
+    df.iloc[:, 3] = -df.iloc[:, 3].abs()
+    return df
+
+
+def expected(values, window):
+    return values.rolling(window).apply(np.prod, raw=True)
+
+
+@pytest.mark.parametrize("window", [1, 3, 14])
+def test_kernel_is_exact(values, window):
+    result = indicators.rolling_product(values, window, method="kernel")
+    pd.testing.assert_frame_equal(result, expected(values, window), check_exact=True)
+
+
+@pytest.mark.parametrize("window", [1, 3, 14])
+def test_log_is_close(values, window):
+    result = indicators.rolling_product(values, window, method="log")
+    np.testing.assert_allclose(result, expected(values, window), rtol=1e-9, atol=1e-12)
+
+
+def test_series_and_short_input(values):
+    series = values["a"]
+    pd.testing.assert_series_equal(indicators.rolling_product(series, 5), expected(series, 5), check_exact=True)
+    assert indicators.rolling_product(series.iloc[:3], 5).isna().all()
+
+
+def test_momentum_matches_pandas(values):
+    value = values.abs() + 1
+    result = indicators.momentum(value, 14)
+    reference = (1 + value.pct_change()).rolling(14).apply(np.prod, raw=True) - 1
+    pd.testing.assert_frame_equal(result, reference, check_exact=True)
+
+
+def test_invalid_arguments(values):
+    with pytest.raises(ValueError):
+        indicators.rolling_product(values, 3, method="fft")
+    with pytest.raises(ValueError):
+        indicators.rolling_product(values, 0)
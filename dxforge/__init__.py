@@ -1 +1,9 @@
-from dxforge.forge import Forge
+# Forge is resolved on first access, so importing the package doesn't pull in docker and httpx
+def __getattr__(name):
+    if name == "Forge":
+        from dxforge.forge import Forge
+        return Forge
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["Forge"]
@@ -1,3 +1,5 @@
-from .orchestrator import Orchestrator
+from .orchestrator import Orchestrator, LazyControllers
 from .controller import Controller
 from .node import Node
+from .scheduler import BuildSession
+from .resources import ResourceScheduler, PlacementError
@@ -2,33 +2,57 @@ from __future__ import annotations
 
 import logging
 import os
+from typing import TYPE_CHECKING
 
-from docker import DockerClient
-from docker.errors import ImageNotFound
 import yaml
 
 from .node import Node
+from .labels import MANAGED, CONTROLLER, NODE, INSTANCE, POOL
+from .scheduler import BuildSession
+from ..telemetry import docker_call
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+
+# parsed compose files, keyed by path and invalidated when the file's mtime changes
+_compose_cache: dict[str, tuple[int, dict]] = {}
+
+
+def load_compose(path: str) -> dict:
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    if (cached := _compose_cache.get(path)) and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r") as f:
+        config = yaml.safe_load(f)
+    _compose_cache[path] = (mtime, config)
+    return config
 
 
 class Controller:
-    def __init__(self, docker_client: DockerClient):
+    def __init__(self, docker_client: DockerClient, state=None, build_parallelism: int = 4, name: str = None,
+                 registry=None, scheduler=None):
+        self.name = name
+        self.registry = registry
+        self.scheduler = scheduler
         self._nodes: dict[str, Node] = {}
         self.docker_client = docker_client
+        self.state = state
+        self.build_parallelism = build_parallelism
         self.logger = logging.Logger(__name__)
 
     @classmethod
-    def from_file(cls, controller_path: str, docker_client: DockerClient):
-        config = yaml.safe_load(open(controller_path, "r"))
+    def from_file(cls, controller_path: str, docker_client: DockerClient, state=None, build_parallelism: int = 4,
+                  name: str = None, registry=None, scheduler=None):
+        config = load_compose(controller_path)
         services = config.get("services", None)
 
-        controller = cls(docker_client)
+        controller = cls(docker_client, state, build_parallelism, name, registry, scheduler)
         for node_name, data in services.items():
-            try:
-                path = cls.get_node_path(data, controller_path)
-                if node := Node.from_dict(path, data):
-                    controller.nodes[node_name] = node
-            except ImageNotFound:
-                continue
+            path = cls.get_node_path(data, controller_path)
+            if node := Node.from_dict(path, data, state=state, name=node_name, controller=name, registry=registry,
+                                     scheduler=scheduler):
+                controller.nodes[node_name] = node
 
         return controller
 
@@ -50,18 +74,35 @@ class Controller:
             node = self.nodes[node]
         return node.get_interface(name)
 
-    def build_node(self, node: Node):
-        for depend_node_name in node.config.depends_on:
-            depend_node = self.nodes[depend_node_name]
-            self.build_node(depend_node)
-        return node.build(self.docker_client)
+    def node_name(self, node: str | Node) -> str:
+        if isinstance(node, str):
+            return node
+        for name, candidate in self.nodes.items():
+            if candidate is node:
+                return name
+        raise ValueError("node does not belong to this controller")
+
+    def build_session(self, parallelism: int = None) -> BuildSession:
+        return BuildSession(self, parallelism if parallelism else self.build_parallelism)
+
+    def build_node(self, node: str | Node, session: BuildSession = None):
+        return self.build_nodes([node], session)
+
+    def build_nodes(self, nodes: list[str | Node] = None, session: BuildSession = None):
+        if nodes is None:
+            nodes = list(self.nodes)
+        session = session if session else self.build_session()
+        return session.build(*[self.node_name(node) for node in nodes])
+
+    def start_node(self, node: Node, **options):
+        return node.start(self.docker_client, **options)
 
-    def start_node(self, node: Node):
-        return node.start(self.docker_client)
+    def scale_node(self, node: Node, replicas: int, **options):
+        return node.scale(self.docker_client, replicas, **options)
 
     @staticmethod
-    def stop_node(node: Node):
-        return node.stop()
+    def stop_node(node: Node, **options):
+        return node.stop(**options)
 
     def status(self):
         status = {
@@ -69,9 +110,7 @@ class Controller:
                 "stopped": [],
                 "running": []
             },
-            "docker-client-containers": {
-                container.name: container.status for container in self.docker_client.containers.list()
-            }
+            "docker-client-containers": self.containers()
         }
         for node_name, node in self.nodes.items():
             try:
@@ -85,6 +124,47 @@ class Controller:
 
         return status
 
+    def reattach(self) -> int:
+        """Restores the instances of this controller after a restart, from container labels and the registry.
+
+        Live containers are adopted as they are, without rebuilding or restarting anything.
+        Returns the number of containers reattached.
+        """
+        with docker_call("containers.list"):
+            containers = self.docker_client.containers.list(
+                all=True, sparse=True, filters={"label": [f"{MANAGED}=true", f"{CONTROLLER}={self.name}"]})
+        rows = self.registry.instances(self.name) if self.registry is not None else []
+        # warm pool containers only get an instance in the registry once claimed
+        by_container = {row["container"]: row["uuid"] for row in rows if row["container"]}
+
+        attached = set()
+        for container in containers:
+            # sparse containers carry their labels at the top level
+            labels = container.attrs.get("Labels") or {}
+            if (node := self.nodes.get(labels.get(NODE))) is None:
+                continue
+            if uuid := labels.get(INSTANCE) or by_container.get(container.id):
+                node.attach(uuid, container)
+                attached.add(uuid)
+            elif POOL in labels:
+                node.pool.adopt(container)
+
+        # instances whose container is gone are kept, they can be started again
+        for row in rows:
+            if row["uuid"] not in attached and (node := self.nodes.get(row["node"])):
+                node.attach(row["uuid"])
+        for node in self.nodes.values():
+            node.record(list(node.instances))
+        return len(attached)
+
+    def containers(self):
+        # answered from the event-driven state cache when it is in sync, without a Docker round trip
+        if self.state is not None and self.state.synced:
+            return {container.name: container.state for container in self.state.containers()}
+        with docker_call("containers.list"):
+            containers = self.docker_client.containers.list()
+        return {container.name: container.status for container in containers}
+
     @property
     def info(self):
         return {
@@ -0,0 +1,7 @@
+# Labels attached to every container started by the forge, used to tell managed containers apart
+MANAGED = "dxforge.managed"
+INSTANCE = "dxforge.instance"
+CONTEXT_HASH = "dxforge.context-hash"
+POOL = "dxforge.pool"
+CONTROLLER = "dxforge.controller"
+NODE = "dxforge.node"
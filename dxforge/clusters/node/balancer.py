@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import itertools
+import threading
+
+
+class Balancer:
+    """Picks the instance of a node that should serve the next request."""
+    STRATEGIES = ("round_robin", "least_outstanding")
+
+    def __init__(self, strategy: str = "round_robin"):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"unknown balancing strategy {strategy}")
+        self.strategy = strategy
+        self.outstanding: dict[str, int] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def pick(self, candidates: list[str]) -> str | None:
+        if not candidates:
+            return None
+        if self.strategy == "least_outstanding":
+            # ties are broken round-robin so idle instances share the load
+            offset = next(self._counter)
+            rotated = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+            return min(rotated, key=lambda uuid: self.outstanding.get(uuid, 0))
+        return candidates[next(self._counter) % len(candidates)]
+
+    def acquire(self, uuid: str):
+        with self._lock:
+            self.outstanding[uuid] = self.outstanding.get(uuid, 0) + 1
+
+    def release(self, uuid: str):
+        with self._lock:
+            if (count := self.outstanding.get(uuid, 0) - 1) > 0:
+                self.outstanding[uuid] = count
+            else:
+                self.outstanding.pop(uuid, None)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import os
+from typing import TYPE_CHECKING
+
+from .node_data import NodeData
+from ..labels import CONTEXT_HASH
+from ...telemetry import docker_call
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+    from docker.models.images import Image
+
+# (mtime_ns, size) -> digest for every file hashed by this process, so unchanged contexts are not re-read
+_file_digests: dict[str, tuple[int, int, str]] = {}
+
+
+def _ignore_patterns(path: str) -> list[str]:
+    patterns = [".git", "**/__pycache__", "**/*.pyc"]
+    ignore_file = os.path.join(path, ".dockerignore")
+    if os.path.exists(ignore_file):
+        with open(ignore_file, "r") as f:
+            for line in f:
+                if not (line := line.strip()) or line.startswith("#"):
+                    continue
+                negated = line.startswith("!")
+                pattern = line.removeprefix("!").strip().strip("/")
+                patterns.append("!" + pattern if negated else pattern)
+    return patterns
+
+
+def _ignored(relative: str, patterns: list[str]) -> bool:
+    # as Docker does: patterns apply in order and the last one matching the path, or one of its parents, wins,
+    # so a `!pattern` re-includes what an earlier pattern excluded
+    parts = relative.split("/")
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    ignored = False
+    for pattern in patterns:
+        negated = pattern.startswith("!")
+        pattern = pattern.removeprefix("!")
+        if any(fnmatch.fnmatch(prefix, pattern) or fnmatch.fnmatch(prefix, pattern.removeprefix("**/"))
+               for prefix in prefixes):
+            ignored = not negated
+    return ignored
+
+
+def _file_digest(file_path: str) -> str:
+    stat = os.stat(file_path)
+    if (cached := _file_digests.get(file_path)) and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    _file_digests[file_path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _base_images(path: str, dockerfile: str) -> list[str]:
+    bases, stages = [], set()
+    with open(os.path.join(path, dockerfile), "r") as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) >= 2 and tokens[0].upper() == "FROM":
+                if tokens[1] not in stages:
+                    bases.append(tokens[1])
+                if len(tokens) >= 4 and tokens[2].upper() == "AS":
+                    stages.add(tokens[3])
+    return bases
+
+
+def context_hash(data: NodeData, docker_client: DockerClient = None) -> str:
+    """Content hash of a node's build context, including the ids of its local base images,
+    so that rebuilding a base image invalidates every image built on top of it."""
+    digest = hashlib.sha256()
+    patterns = _ignore_patterns(data.path)
+    for root, dirs, files in os.walk(data.path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            relative = os.path.relpath(file_path, data.path).replace(os.sep, "/")
+            if _ignored(relative, patterns):
+                continue
+            digest.update(relative.encode())
+            digest.update(_file_digest(file_path).encode())
+
+    from docker.errors import ImageNotFound
+
+    for base in _base_images(data.path, data.dockerfile):
+        digest.update(base.encode())
+        if docker_client is not None:
+            try:
+                with docker_call("images.get"):
+                    digest.update(docker_client.images.get(base).id.encode())
+            except ImageNotFound:
+                pass
+    return digest.hexdigest()
+
+
+def find_image(docker_client: DockerClient, digest: str) -> Image | None:
+    with docker_call("images.list"):
+        images = docker_client.images.list(filters={"label": f"{CONTEXT_HASH}={digest}"})
+    return images[0] if images else None
+
+
+def build_image(docker_client: DockerClient, data: NodeData) -> tuple[Image, str, bool]:
+    """Builds the node image, unless an image with the same context hash already exists.
+
+    Returns the image, the context hash and whether the build was skipped."""
+    digest = context_hash(data, docker_client)
+    if image := find_image(docker_client, digest):
+        if data.image_tag and data.image_tag not in image.tags:
+            repository, _, tag = data.image_tag.rpartition(":")
+            if "/" in tag or not repository:
+                repository, tag = data.image_tag, None
+            with docker_call("image.tag"):
+                image.tag(repository, tag)
+        return image, digest, True
+
+    with docker_call("images.build"):
+        image, _ = docker_client.images.build(
+            path=data.path,
+            dockerfile=data.dockerfile,
+            tag=data.image_tag,
+            labels={CONTEXT_HASH: digest},
+        )
+    return image, digest, False
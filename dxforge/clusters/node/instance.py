@@ -1,67 +1,128 @@
-from docker import DockerClient
-from docker.models.containers import Container
-from docker.models.images import Image
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
 
 from .node_data import NodeData
+from .pool import WarmPool, container_options
+from ..labels import INSTANCE
+from ..resources import resource_options
+from ...telemetry import docker_call, instance_starts
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+    from docker.models.containers import Container
 
 
 class Instance:
     def __init__(self,
                  data: NodeData = None,
+                 uuid: str = None,
+                 state=None,
+                 labels: dict = None,
+                 scheduler=None,
                  ):
         self.data = data
+        self.uuid = uuid
+        self.state = state
+        self.labels = labels if labels else {}
+        self.scheduler = scheduler
         self._container: Container | None = None
-        self._image: Image | None = None
+        # whether the instance is meant to be running, and restarted by the supervisor if it isn't
+        self.supervised = False
+
+    @property
+    def container_state(self):
+        if self._container and self.state is not None and self.state.synced:
+            return self.state.get(self._container.id)
+        return None
 
     @property
     def alive(self):
         if not self._container:
             return False
+        if container_state := self.container_state:
+            return container_state.running
         return self._container.status == "running"
 
     @property
     def ip(self):
-        if self._container:
-            if self.data.network == "host":
-                return "localhost"
-            elif self.data.network == "bridge":
-                return self._container.attrs["NetworkSettings"]["IPAddress"]
-            else:
-                return self._container.attrs["NetworkSettings"]["Networks"][self.data.network]["IPAddress"]
-
-        return None
-
-    def build(self, docker_client: DockerClient) -> Image:
-        return docker_client.images.build(
-            path=self.data.path,
-            tag=self.data.image_tag
-        )
+        if not self._container:
+            return None
+        # host network containers have no address of their own, the cache never has one for them
+        if self.data.network == "host":
+            return "localhost"
+        if container_state := self.container_state:
+            return container_state.ip
+        if self.data.network == "bridge":
+            return self._container.attrs["NetworkSettings"]["IPAddress"]
+        return self._container.attrs["NetworkSettings"]["Networks"][self.data.network]["IPAddress"]
 
-    def start(self, docker_client: DockerClient) -> Container:
-        container = docker_client.containers.run(
-            image=self.data.image_tag,
-            expose=self.data.ports,
-            network=self.data.network,
-            detach=True,
-        )
+    def start(self, docker_client: DockerClient, pool: WarmPool = None) -> Container:
+        start = time.perf_counter()
+        if self.scheduler is not None:
+            # raises before anything is created if the host has no room left
+            resources = self.scheduler.options(self.scheduler.allocate(self.uuid, self.data))
+        else:
+            resources = resource_options(self.data)
+        try:
+            if pool is not None and (container := pool.claim()) is not None:
+                source = "warm"
+                try:
+                    # pool containers are created before their instance is placed
+                    with docker_call("container.update"):
+                        container.update(**resources)
+                except Exception:
+                    pool.discard(container)
+                    raise
+                # pool containers are labelled before they belong to an instance
+                if self.state is not None:
+                    self.state.assign(container.id, self.uuid)
+            else:
+                source = "cold"
+                with docker_call("containers.run"):
+                    container = docker_client.containers.run(
+                        **container_options(self.data, {**self.labels, INSTANCE: str(self.uuid)}),
+                        **resources,
+                        detach=True,
+                    )
+        except Exception:
+            if self.scheduler is not None:
+                self.scheduler.release(self.uuid)
+            raise
+        if self.scheduler is not None:
+            self.scheduler.bind(self.uuid, container)
+        if pool is not None:
+            # cold starts too, the pool is empty after a restart of the forge or before the node is built here
+            pool.refill(docker_client)
+        instance_starts.observe(time.perf_counter() - start, self.data.image_tag, source)
         self._container = container
+        self.supervised = True
         return container
 
     def stop(self):
+        self.supervised = False
         if self._container:
-            self._container.stop()
-            self._container.remove()
+            with docker_call("container.stop"):
+                self._container.stop()
+            with docker_call("container.remove"):
+                self._container.remove()
             self._container = None
+        if self.scheduler is not None:
+            self.scheduler.release(self.uuid)
 
-    def logs(self):
+    def logs(self, **kwargs):
         if self._container:
-            return self._container.logs()
+            with docker_call("container.logs"):
+                return self._container.logs(**kwargs)
         return None
 
     @property
     def info(self):
+        container_state = self.container_state
         return {
             "ip": self.ip,
             "ports": self.data.ports,
             "network": self.data.network,
+            "state": container_state.info if container_state else None,
         }
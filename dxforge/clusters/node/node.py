@@ -1,12 +1,24 @@
+from __future__ import annotations
+
 import subprocess
-from typing import Tuple, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Tuple, Dict, TYPE_CHECKING
 from uuid import uuid4
 
-import httpx
-from docker import DockerClient
-
+from .balancer import Balancer
+from .image import build_image
 from .instance import Instance
 from .node_data import NodeData
+from .pool import WarmPool
+from ..labels import CONTROLLER, NODE
+from ..resources import parse_memory, parse_cpuset
+from ...events import publish
+from ...telemetry import docker_call
+
+if TYPE_CHECKING:
+    from docker import DockerClient
 
 
 def build(compose_file: str, service_name: str, docker):
@@ -20,17 +32,42 @@ def build(compose_file: str, service_name: str, docker):
 
 
 class Node:
-    def __init__(self, config: NodeData, instance_config=None):
+    workers = 8
+
+    def __init__(self, config: NodeData, instance_config=None, state=None, balancer: str = "round_robin",
+                 warm_pool: int = 0, warm_mode: str = "paused", name: str = None, controller: str = None,
+                 registry=None, health: str = None, scheduler=None):
+        self.name = name
+        self.controller = controller
         self._config = config
         self.instance_config = instance_config
+        self.state = state
+        self.registry = registry
+        self.scheduler = scheduler
+        self.context_hash: str | None = None
+        # HTTP path probed on the first exposed port of each instance by the supervisor
+        self.health = health
         self.instances: Dict[str, Instance] = {}
+        self.balancer = Balancer(balancer)
+        self.pool = WarmPool(config, warm_pool, warm_mode, self.labels)
+        self._build_lock = threading.Lock()
 
     @classmethod
-    def from_dict(cls, path, config: dict, instance_config=None) -> 'Node':
+    def from_dict(cls, path, config: dict, instance_config=None, state=None, name: str = None,
+                  controller: str = None, registry=None, scheduler=None) -> 'Node':
         if ports := config.get("expose"):
             ports = [int(port) for port in ports]
         else:
             ports = []
+        build = config.get("build") if isinstance(config.get("build"), dict) else {}
+        # forge specific settings live under the compose extension field `x-dxforge`
+        forge_config = config.get("x-dxforge", {})
+        # swarm style `deploy.resources` or the plain service keys
+        resources = (config.get("deploy") or {}).get("resources") or {}
+        limits = resources.get("limits") or {}
+        reservations = resources.get("reservations") or {}
+        cpu_limit = limits.get("cpus", config.get("cpus"))
+        cpu_request = reservations.get("cpus")
         config = NodeData(
             path=path,
             image_tag=config.get("image"),
@@ -38,13 +75,36 @@ class Node:
             ports=ports,
             env=config.get("env"),
             network=config.get("network"),
+            dockerfile=build.get("dockerfile"),
+            cpu_request=float(cpu_request) if cpu_request is not None else None,
+            cpu_limit=float(cpu_limit) if cpu_limit is not None else None,
+            memory_request=parse_memory(reservations.get("memory", config.get("mem_reservation"))),
+            memory_limit=parse_memory(limits.get("memory", config.get("mem_limit"))),
+            cpuset=parse_cpuset(config.get("cpuset")),
+            pin=forge_config.get("pin", False),
+            priority=forge_config.get("priority", "normal"),
         )
 
-        return cls(config, instance_config)
+        return cls(config, instance_config, state,
+                   balancer=forge_config.get("balancer", "round_robin"),
+                   warm_pool=forge_config.get("warm_pool", 0),
+                   warm_mode=forge_config.get("warm_mode", "paused"),
+                   name=name,
+                   controller=controller,
+                   registry=registry,
+                   health=forge_config.get("health"),
+                   scheduler=scheduler)
 
     @property
     def client(self):
-        return httpx.AsyncClient()
+        # imported here since the control package itself depends on clusters
+        from ...control import HttpPool
+        return HttpPool().client
+
+    @property
+    def labels(self) -> dict:
+        labels = {CONTROLLER: self.controller, NODE: self.name}
+        return {key: value for key, value in labels.items() if value is not None}
 
     @property
     def config(self):
@@ -54,43 +114,220 @@ class Node:
     def info(self):
         return {
             "instances": {uuid: instance.alive for uuid, instance in self.instances.items()},
-            "instance_config": self.instance_config
+            "instance_config": self.instance_config,
+            "warm_pool": len(self.pool),
         }
 
     def create_instance(self, uuid: str = None):
-        if uuid is None:
-            uuid = uuid4()
-        self.instances[uuid] = Instance(self._config)
+        # instances are keyed by the string form of their uuid, as used in routes and container labels
+        uuid = str(uuid) if uuid is not None else str(uuid4())
+        self.instances[uuid] = Instance(self._config, uuid, self.state, self.labels, self.scheduler)
+        if self.registry is not None:
+            self.registry.add(uuid, self.controller, self.name)
+        publish("instance.created", controller=self.controller, node=self.name, instance=uuid)
 
         return uuid
 
-    def _run(self, func, *args, **kwargs):
+    def _run(self, func, *args,
+             workers: int = None,
+             timeout: float = None,
+             deadline: float = None,
+             fail_fast: bool = False,
+             targets: list = None,
+             **kwargs):
+        """Applies `func` to every instance concurrently.
+
+        `timeout` bounds each instance and `deadline` the whole operation, both in seconds. With `fail_fast`,
+        instances that have not started yet are cancelled after the first error. Instances that are given up on
+        while running (past their time, or after an error with `fail_fast`) are reported as errors saying so: their
+        threads can't be interrupted and finish in the background.
+        """
         success = set()
         errors = {}
-        for uuid, instance in self.instances.items():
+        timings = {}
+        started = {}
+        start = time.monotonic()
+        end = start + deadline if deadline is not None else None
+
+        def call(uuid, instance):
+            started[uuid] = time.monotonic()
             try:
-                func(instance, *args, **kwargs)
-                success.add(str(uuid))
-            except Exception as e:
-                errors[str(uuid)] = str(e)
+                return func(instance, *args, **kwargs)
+            finally:
+                timings[uuid] = time.monotonic() - started[uuid]
+
+        executor = ThreadPoolExecutor(max_workers=workers if workers else self.workers,
+                                      thread_name_prefix="dxforge-node")
+        instances = list(self.instances.items()) if targets is None else [(uuid, self.instances[uuid]) for uuid in targets]
+        futures = {executor.submit(call, str(uuid), instance): str(uuid) for uuid, instance in instances}
+        pending = set(futures)
+        try:
+            while pending:
+                now = time.monotonic()
+                waits = [started[futures[future]] + timeout - now
+                         for future in pending if timeout is not None and futures[future] in started]
+                if end is not None:
+                    waits.append(end - now)
+                done, pending = wait(pending, timeout=max(min(waits), 0) if waits else None,
+                                     return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    uuid = futures[future]
+                    if future.cancelled():
+                        errors[uuid] = "cancelled"
+                    elif error := future.exception():
+                        errors[uuid] = str(error)
+                    else:
+                        success.add(uuid)
+
+                now = time.monotonic()
+                for future in list(pending):
+                    uuid = futures[future]
+                    if timeout is not None and uuid in started and now - started[uuid] >= timeout:
+                        errors[uuid] = f"timed out after {timeout}s, abandoned while still running"
+                        pending.discard(future)
+                    elif end is not None and now >= end:
+                        errors[uuid] = f"deadline of {deadline}s exceeded" + (
+                            "" if future.cancel() else ", abandoned while still running")
+                        pending.discard(future)
+
+                if fail_fast and errors:
+                    for future in pending:
+                        # only instances that haven't started can be cancelled
+                        errors[futures[future]] = "cancelled" if future.cancel() else "abandoned while still running"
+                    pending = set()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
         return {
             "success": success,
-            "errors": errors
+            "errors": errors,
+            "timings": {uuid: timings.get(uuid) for uuid in futures.values()},
+            "duration": time.monotonic() - start,
         }
 
     def build(self, docker_client: DockerClient):
-        return self._run(Instance.build, docker_client)
+        # one image per node, shared by all of its instances
+        with self._build_lock:
+            image, digest, cached = build_image(docker_client, self._config)
+        self.context_hash = digest
+        if not cached:
+            # warm containers run the previous image
+            self.pool.drain()
+        self.pool.refill(docker_client)
+        return {
+            "success": set(self.instances),
+            "errors": {},
+            "image": image.short_id,
+            "hash": digest,
+            "cached": cached,
+        }
+
+    def start(self, docker_client: DockerClient, **options):
+        result = self._run(Instance.start, docker_client, pool=self.pool if self.pool.size else None, **options)
+        self.record(result["success"])
+        return result
+
+    def stop(self, **options):
+        result = self._run(Instance.stop, **options)
+        self.record(result["success"])
+        return result
+
+    def attach(self, uuid: str, container=None) -> Instance:
+        """Adopts an instance, and its container if it still exists, after a forge restart."""
+        if (instance := self.instances.get(uuid)) is None:
+            instance = self.instances[uuid] = Instance(self._config, uuid, self.state, self.labels, self.scheduler)
+        instance._container = container
+        instance.supervised = container is not None
+        if container is not None and self.state is not None:
+            self.state.assign(container.id, uuid)
+        if container is not None and self.scheduler is not None:
+            try:
+                allocation = self.scheduler.allocate(uuid, self._config)
+                self.scheduler.bind(uuid, container)
+                with docker_call("container.update"):
+                    container.update(**self.scheduler.options(allocation))
+            except Exception:
+                # the container keeps running with the resources it was started with
+                self.scheduler.release(uuid)
+        return instance
+
+    def restart(self, uuid: str, docker_client: DockerClient):
+        """Replaces the container of a single instance, leaving the others untouched."""
+        from docker.errors import NotFound
+
+        instance = self.instances[uuid]
+        try:
+            try:
+                instance.stop()
+            except NotFound:
+                # the container is already gone
+                instance._container = None
+            instance.start(docker_client, pool=self.pool if self.pool.size else None)
+        except Exception:
+            # stop() gave up supervising it, but the instance is still meant to run and its restart is retried
+            instance.supervised = True
+            raise
+        finally:
+            self.record([uuid])
+        return instance
+
+    def record(self, uuids):
+        """Writes the current container of each instance to the registry, forgetting removed instances."""
+        if self.registry is None:
+            return
+        for uuid in uuids:
+            if (instance := self.instances.get(uuid)) is None:
+                self.registry.remove(uuid)
+                continue
+            container = instance._container
+            image = (container.attrs.get("Image") or container.attrs.get("ImageID")) if container else None
+            self.registry.update(uuid, container.id if container else None, image, self.context_hash)
+
+    def scale(self, docker_client: DockerClient, replicas: int, **options):
+        """Creates or removes instances until there are `replicas` of them, starting only the new ones."""
+        if replicas < 0:
+            raise ValueError("replicas must be non-negative")
+        current = list(self.instances)
+        created = [self.create_instance() for _ in range(replicas - len(current))]
+        # stopped instances are the first to go
+        removed = sorted(current, key=lambda uuid: self.instances[uuid].alive)[:max(len(current) - replicas, 0)]
+
+        result = {"replicas": replicas, "created": created, "removed": []}
+        if created:
+            result["start"] = self._run(Instance.start, docker_client, targets=created,
+                                        pool=self.pool if self.pool.size else None, **options)
+            # instances that failed to start don't count as replicas, so scaling again retries them
+            for uuid in created:
+                if uuid in result["start"]["errors"]:
+                    self.instances.pop(uuid, None)
+        if removed:
+            result["stop"] = self._run(Instance.stop, targets=removed, **options)
+            for uuid in removed:
+                if uuid not in result["stop"]["errors"]:
+                    self.instances.pop(uuid, None)
+                    result["removed"].append(uuid)
+        self.record(created + removed)
+        return result
 
-    def start(self, docker_client: DockerClient):
-        return self._run(Instance.start, docker_client)
+    @property
+    def alive(self):
+        return any(instance.alive for instance in list(self.instances.values()))
+
+    @property
+    def healthy(self) -> list[str]:
+        return [uuid for uuid, instance in list(self.instances.items()) if instance.alive and instance.ip]
 
-    def stop(self):
-        return self._run(Instance.stop)
+    def pick_instance(self) -> str | None:
+        return self.balancer.pick(self.healthy)
 
     def get_interface(self, name=None) -> Tuple[int, str]:
-        if name is None:
-            raise NotImplementedError("No instance union implemented")
-        return self._config.ports[name], self.instances[name].info["host"]
+        """Port and host of an instance, picked by the node balancer when no instance uuid is given."""
+        if name is None and (name := self.pick_instance()) is None:
+            raise RuntimeError("no healthy instance available")
+        if not self._config.ports:
+            raise RuntimeError("node exposes no ports")
+        return self._config.ports[0], self.instances[str(name)].ip
 
-    def log(self, uuid):
-        return self.instances[uuid].logs()
+    def log(self, uuid, **kwargs):
+        return self.instances[uuid].logs(**kwargs)
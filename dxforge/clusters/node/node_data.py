@@ -10,10 +10,28 @@ class NodeData:
                  depends_on: List[str] = None,
                  ports: List[int] = None,
                  env: Dict[str, str] = None,
-                 network='host'):
+                 network='host',
+                 dockerfile: str = 'Dockerfile',
+                 cpu_request: float = None,
+                 cpu_limit: float = None,
+                 memory_request: int = None,
+                 memory_limit: int = None,
+                 cpuset: List[int] = None,
+                 pin: bool = False,
+                 priority: str = 'normal'):
         self.path = path
         self.image_tag = image_tag
         self.depends_on = depends_on if depends_on else []
         self.ports = ports if ports else []
         self.env = env
         self.network = network
+        self.dockerfile = dockerfile if dockerfile else 'Dockerfile'
+        # cpus and bytes, requests are what the scheduler reserves, limits what the container is capped at
+        self.cpu_request = cpu_request
+        self.cpu_limit = cpu_limit
+        self.memory_request = memory_request
+        self.memory_limit = memory_limit
+        # cores the instances must run on, or with `pin` cores reserved to each instance by the scheduler
+        self.cpuset = cpuset if cpuset else []
+        self.pin = pin
+        self.priority = priority if priority else 'normal'
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from typing import TYPE_CHECKING
+
+from .node_data import NodeData
+from ..labels import MANAGED, POOL
+from ...telemetry import docker_call
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+    from docker.models.containers import Container
+
+
+def container_options(data: NodeData, labels: dict) -> dict:
+    return {
+        "image": data.image_tag,
+        "expose": data.ports,
+        "network": data.network,
+        "labels": {MANAGED: "true", **labels},
+    }
+
+
+class WarmPool:
+    """Containers of a node created ahead of time, so that starting an instance only has to claim one.
+
+    In `paused` mode the containers are started and then paused, so the process inside is already up,
+    in `created` mode they are only created and claiming one starts it.
+    """
+    MODES = ("paused", "created")
+
+    def __init__(self, data: NodeData, size: int = 0, mode: str = "paused", labels: dict = None):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown warm pool mode {mode}")
+        self.data = data
+        self.labels = labels if labels else {}
+        self.size = size
+        self.mode = mode
+        self._containers: deque[Container] = deque()
+        self._lock = threading.Lock()
+        self._filling = threading.Lock()
+        self.logger = logging.Logger(__name__)
+
+    def __len__(self):
+        return len(self._containers)
+
+    def adopt(self, container: Container):
+        with self._lock:
+            self._containers.append(container)
+
+    def claim(self) -> Container | None:
+        while True:
+            with self._lock:
+                if not self._containers:
+                    return None
+                container = self._containers.popleft()
+            try:
+                if self.mode == "paused":
+                    with docker_call("container.unpause"):
+                        container.unpause()
+                else:
+                    with docker_call("container.start"):
+                        container.start()
+                return container
+            except Exception as e:
+                self.logger.warning(f"Discarding warm container {container.name}: {e}")
+                self.discard(container)
+
+    def fill(self, docker_client: DockerClient):
+        # a single filler at a time, concurrent calls return immediately
+        if not self._filling.acquire(blocking=False):
+            return
+        try:
+            while len(self._containers) < self.size:
+                with docker_call("containers.create"):
+                    container = docker_client.containers.create(
+                        **container_options(self.data, {**self.labels, POOL: self.data.image_tag or "true"}))
+                if self.mode == "paused":
+                    with docker_call("container.start"):
+                        container.start()
+                    with docker_call("container.pause"):
+                        container.pause()
+                with self._lock:
+                    self._containers.append(container)
+        except Exception as e:
+            self.logger.warning(f"Failed filling warm pool of {self.data.image_tag}: {e}")
+        finally:
+            self._filling.release()
+
+    def refill(self, docker_client: DockerClient):
+        if self.size and len(self._containers) < self.size:
+            threading.Thread(target=self.fill, args=(docker_client,), name="dxforge-pool", daemon=True).start()
+
+    def drain(self):
+        with self._lock:
+            containers, self._containers = list(self._containers), deque()
+        for container in containers:
+            self.discard(container)
+
+    @staticmethod
+    def discard(container: Container):
+        try:
+            with docker_call("container.remove"):
+                container.remove(force=True)
+        except Exception:
+            pass
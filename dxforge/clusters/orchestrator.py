@@ -1,15 +1,60 @@
-import asyncio
-from typing import Dict
+from __future__ import annotations
 
-import docker
+import asyncio
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, TYPE_CHECKING
 
 from .controller import Controller
+from .labels import MANAGED
+from ..telemetry import docker_call
+
+if TYPE_CHECKING:
+    import docker
+
+
+class LazyControllers(Mapping):
+    """Controllers by name, each parsed from its compose file the first time it is accessed."""
+
+    def __init__(self, paths: Dict[str, str], factory: Callable[[str, str], Controller]):
+        self._paths = paths
+        self._factory = factory
+        self._controllers: Dict[str, Controller] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> Dict[str, Controller]:
+        return dict(self._controllers)
+
+    def __getitem__(self, name: str) -> Controller:
+        if name not in self._controllers:
+            path = self._paths[name]
+            with self._lock:
+                if name not in self._controllers:
+                    self._controllers[name] = self._factory(name, path)
+        return self._controllers[name]
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
 
 
 class Orchestrator:
-    def __init__(self, controllers: Dict[str, Controller], docker_client: docker.DockerClient):
+    def __init__(self, controllers: Dict[str, Controller] | LazyControllers, docker_client: docker.DockerClient,
+                 state=None, name: str = "local", stats=None, parallelism: int = 8, grace: float = 10,
+                 stop_containers: bool = True, scheduler=None):
         self.controllers = controllers
         self.docker_client = docker_client
+        self.state = state
+        self.name = name
+        self.stats = stats
+        self.parallelism = parallelism
+        self.grace = grace
+        self.stop_containers = stop_containers
+        self.scheduler = scheduler
 
     def status(self):
         status = {
@@ -31,15 +76,61 @@ class Orchestrator:
     def info(self):
         return {
             "controllers": {controller: self.controllers[controller].info for controller in self.controllers},
+            "resources": self.scheduler.info if self.scheduler is not None else None,
         }
 
-    @staticmethod
-    async def stop_containers(container):
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, container.stop)
+    def start(self):
+        """Starts following the containers of this host, which connects to its Docker daemon."""
+        if self.state is not None:
+            self.state.start()
+        if self.stats is not None:
+            self.stats.start()
+
+    def stop_container(self, container):
+        # SIGTERM, then SIGKILL once the grace period is over
+        with docker_call("container.stop"):
+            container.stop(timeout=self.grace)
+        with docker_call("container.remove"):
+            container.remove()
+
+    async def stop(self, progress: Callable[[int, int, str, str | None], None] = None):
+        """Stops and removes every container started by the forge on this host, `parallelism` at a time.
+
+        `progress` is called after each container with the number handled so far, the total,
+        the container name and the error, if any.
+        Without `stop_containers` the containers are left running, to be reattached on the next start.
+        """
+        if self.state is not None:
+            self.state.stop()
+        if self.stats is not None:
+            self.stats.stop()
+        if not self.stop_containers:
+            self.docker_client.close()
+            return
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="dxforge-shutdown")
+
+        def list_containers():
+            with docker_call("containers.list"):
+                return self.docker_client.containers.list(all=True, filters={"label": f"{MANAGED}=true"})
+
+        try:
+            containers = await loop.run_in_executor(executor, list_containers)
+            done = 0
+
+            async def stop(container):
+                nonlocal done
+                error = None
+                try:
+                    await loop.run_in_executor(executor, self.stop_container, container)
+                except Exception as e:
+                    error = str(e)
+                done += 1
+                if progress is not None:
+                    progress(done, len(containers), container.name, error)
 
-    async def stop(self):
-        await asyncio.gather(
-            *[self.stop_containers(container) for container in self.docker_client.containers.list()]
-        )
-        self.docker_client.close()
+            await asyncio.gather(*[stop(container) for container in containers])
+        finally:
+            executor.shutdown(wait=False)
+            self.docker_client.close()
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ..telemetry import docker_call
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+    from docker.models.containers import Container
+    from .node.node_data import NodeData
+
+# cpu shares of each priority class, weighing instances against each other when their cores are contended
+PRIORITY_CLASSES = {
+    "critical": 4096,
+    "high": 2048,
+    "normal": 1024,
+    "low": 512,
+    "batch": 256,
+}
+CPU_PERIOD = 100_000
+_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_memory(value) -> int | None:
+    """Bytes from a compose memory value, `512m`, `1gb`, `2G` or a plain number of bytes."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip().lower()
+    if value.endswith("b"):
+        value = value[:-1]
+    unit = value[-1] if value and value[-1] in _UNITS else ""
+    number = value[:-1] if unit else value
+    try:
+        return int(float(number) * _UNITS[unit])
+    except ValueError:
+        raise ValueError(f"invalid memory value {value!r}")
+
+
+def parse_cpuset(value) -> list[int]:
+    """Core numbers from a cpuset, `0-3,6` or a list of cores."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return sorted(int(core) for core in value)
+    cores = set()
+    for part in str(value).split(","):
+        if not (part := part.strip()):
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cores.update(range(int(first), int(last) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def format_cpuset(cores) -> str:
+    return ",".join(str(core) for core in sorted(cores))
+
+
+def resource_options(data: NodeData, cores=None) -> dict:
+    """Keyword arguments of `containers.run` and `container.update` enforcing the limits of a node."""
+    if data.priority not in PRIORITY_CLASSES:
+        raise ValueError(f"unknown priority class {data.priority}")
+    options = {"cpu_shares": PRIORITY_CLASSES[data.priority]}
+    if cores is None:
+        cores = data.cpuset
+    if cores:
+        options["cpuset_cpus"] = format_cpuset(cores)
+    if data.cpu_limit:
+        # cpu_period and cpu_quota rather than nano_cpus, which can't be updated on a running container
+        options["cpu_period"] = CPU_PERIOD
+        options["cpu_quota"] = int(data.cpu_limit * CPU_PERIOD)
+    if data.memory_limit:
+        options["mem_limit"] = data.memory_limit
+        options["memswap_limit"] = data.memory_limit
+    if data.memory_request:
+        options["mem_reservation"] = data.memory_request
+    return options
+
+
+class PlacementError(Exception):
+    pass
+
+
+@dataclass
+class Allocation:
+    uuid: str
+    data: NodeData
+    cpu: float
+    memory: int
+    # cores held exclusively by the instance, none if it runs on the shared cores
+    cores: tuple = ()
+    # the compose cpuset, limiting the cores the instance may run on without holding them
+    allowed: tuple = ()
+
+    @property
+    def info(self):
+        return {
+            "cpu": self.cpu,
+            "memory": self.memory,
+            "cores": list(self.cores),
+            "allowed": list(self.allowed),
+            "priority": self.data.priority,
+        }
+
+
+class ResourceScheduler:
+    """Packs the instances of a Docker host onto its cores and memory without oversubscribing them.
+
+    Pinned instances (`pin`) hold whole cores of their own, every other instance runs on the remaining shared cores,
+    whose requests must fit in them. A compose `cpuset` only limits the cores an instance may use, as with compose:
+    its instances run on the shared cores within it, and pinned ones take their cores from it. Placements that would
+    exceed the capacity of the host are rejected with a `PlacementError`. Capacity is read from the daemon unless set
+    in the host config.
+    """
+
+    def __init__(self, docker_client: DockerClient, cpus: int = None, memory: int = None, reserved=()):
+        self.docker_client = docker_client
+        self._cpus = cpus
+        self._memory = memory
+        # cores left to the host itself, never given to an instance
+        self.reserved = set(reserved)
+        self._allocations: dict[str, Allocation] = {}
+        self._containers: dict[str, Container] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.Logger(__name__)
+
+    @classmethod
+    def from_config(cls, docker_client: DockerClient, config: dict) -> 'ResourceScheduler':
+        return cls(
+            docker_client,
+            cpus=config.get("cpus"),
+            memory=parse_memory(config.get("memory")),
+            reserved=parse_cpuset(config.get("reserved")),
+        )
+
+    def capacity(self) -> tuple[int, int]:
+        if self._cpus is None or self._memory is None:
+            with docker_call("info"):
+                info = self.docker_client.info()
+            if self._cpus is None:
+                self._cpus = info.get("NCPU", 1)
+            if self._memory is None:
+                self._memory = info.get("MemTotal", 0)
+        return self._cpus, self._memory
+
+    @property
+    def cores(self) -> list[int]:
+        cpus, _ = self.capacity()
+        return [core for core in range(cpus) if core not in self.reserved]
+
+    def _shared_cores(self) -> list[int]:
+        pinned = {core for allocation in self._allocations.values() for core in allocation.cores}
+        return [core for core in self.cores if core not in pinned]
+
+    @staticmethod
+    def _allowed(allowed, shared: list[int]) -> list[int]:
+        return [core for core in shared if core in allowed] if allowed else shared
+
+    @property
+    def shared_cores(self) -> list[int]:
+        with self._lock:
+            return self._shared_cores()
+
+    def allocate(self, uuid: str, data: NodeData) -> Allocation:
+        cpus, memory = self.capacity()
+        with self._lock:
+            if allocation := self._allocations.get(uuid):
+                return allocation
+            cpu = data.cpu_request or data.cpu_limit or 0
+            requested_memory = data.memory_request or data.memory_limit or 0
+
+            used_memory = sum(allocation.memory for allocation in self._allocations.values())
+            if memory and used_memory + requested_memory > memory:
+                raise PlacementError(f"{requested_memory} bytes of memory requested, "
+                                     f"{memory - used_memory} left on the host")
+
+            shared = self._shared_cores()
+            allowed = self._allowed(data.cpuset, shared)
+            if data.cpuset:
+                if unknown := [core for core in data.cpuset if core not in self.cores]:
+                    raise PlacementError(f"cores {format_cpuset(unknown)} are reserved or not on the host")
+                if not allowed:
+                    raise PlacementError(f"cores {format_cpuset(data.cpuset)} are all pinned")
+            if data.pin:
+                count = max(math.ceil(cpu), 1)
+                if len(allowed) < count:
+                    raise PlacementError(f"{count} cores requested, {len(allowed)} left to pin")
+                # the highest cores, the lowest ones usually carry the host's own work
+                cores = tuple(allowed[-count:])
+                remaining = [core for core in shared if core not in cores]
+                for other in self._allocations.values():
+                    if not other.cores and not self._allowed(other.allowed, remaining):
+                        raise PlacementError(f"pinning cores {format_cpuset(cores)} would leave instance "
+                                             f"{other.uuid} no core to run on")
+            elif not shared:
+                raise PlacementError("every core is reserved or pinned")
+            else:
+                cores = ()
+                if cpu > len(allowed):
+                    raise PlacementError(f"{cpu} cpus requested within cpuset {format_cpuset(data.cpuset)}")
+
+            shared_cpu = sum(allocation.cpu for allocation in self._allocations.values() if not allocation.cores)
+            if not cores:
+                shared_cpu += cpu
+            if shared_cpu > len(shared) - len(cores):
+                raise PlacementError(f"{shared_cpu} cpus requested on the shared cores, "
+                                     f"{len(shared) - len(cores)} of them left")
+
+            allocation = self._allocations[uuid] = Allocation(uuid, data, cpu, requested_memory, cores,
+                                                              tuple(data.cpuset))
+        if cores:
+            # shared instances move off the newly pinned cores
+            self._rebalance()
+        return allocation
+
+    def options(self, allocation: Allocation) -> dict:
+        cores = allocation.cores or self._allowed(allocation.allowed, self.shared_cores)
+        return resource_options(allocation.data, cores)
+
+    def bind(self, uuid: str, container: Container):
+        with self._lock:
+            if uuid in self._allocations:
+                self._containers[uuid] = container
+
+    def release(self, uuid: str):
+        with self._lock:
+            allocation = self._allocations.pop(uuid, None)
+            self._containers.pop(uuid, None)
+        if allocation is not None and allocation.cores:
+            self._rebalance()
+
+    def _rebalance(self):
+        with self._lock:
+            shared = self._shared_cores()
+            containers = [(container, format_cpuset(self._allowed(self._allocations[uuid].allowed, shared)))
+                          for uuid, container in self._containers.items() if not self._allocations[uuid].cores]
+        for container, cpuset in containers:
+            try:
+                with docker_call("container.update"):
+                    container.update(cpuset_cpus=cpuset)
+            except Exception as e:
+                self.logger.warning(f"Failed moving container {container.id} to cores {cpuset}: {e}")
+
+    @property
+    def info(self):
+        # capacity is only looked up on the first placement, info doesn't reach out to the daemon
+        with self._lock:
+            allocations = list(self._allocations.values())
+            shared = self._shared_cores() if self._cpus is not None else None
+        return {
+            "cpus": self._cpus,
+            "memory": self._memory,
+            "reserved": sorted(self.reserved),
+            "shared": shared,
+            "cpu": sum(allocation.cpu for allocation in allocations),
+            "allocated_memory": sum(allocation.memory for allocation in allocations),
+            "allocations": {allocation.uuid: allocation.info for allocation in allocations},
+        }
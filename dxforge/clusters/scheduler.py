@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from ..events import publish
+
+if TYPE_CHECKING:
+    from .controller import Controller
+
+
+class NodeBuild:
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"
+        self.result = None
+        self.error: str | None = None
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    @property
+    def ok(self):
+        return self.status == "built"
+
+    @property
+    def done(self):
+        return self.status in ("built", "failed", "skipped")
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def info(self):
+        return {
+            "status": self.status,
+            "duration": self.duration,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class BuildSession:
+    """Builds the nodes of a controller following their `depends_on` graph.
+
+    Every node is built at most once per session, and nodes whose dependencies are satisfied
+    are built concurrently, up to `parallelism` at a time. A call needing a node that another call on the same
+    session is building waits for it rather than building it again.
+    """
+
+    def __init__(self, controller: Controller, parallelism: int = 4):
+        self.controller = controller
+        self.parallelism = max(1, parallelism)
+        self.builds: dict[str, NodeBuild] = {}
+        self._lock = threading.Lock()
+        # notified whenever a node of the session is done, whichever `build` call built it
+        self._finished = threading.Condition(self._lock)
+
+    def dependencies(self, name: str) -> list[str]:
+        if name not in self.controller.nodes:
+            raise ValueError(f"unknown node {name}")
+        return self.controller.nodes[name].config.depends_on
+
+    def order(self, names) -> list[str]:
+        order = []
+        visiting, visited = set(), set()
+
+        def visit(name, path):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"dependency cycle: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dependency in self.dependencies(name):
+                visit(dependency, path + [name])
+            visiting.remove(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in names:
+            visit(name, [])
+        return order
+
+    def build(self, *names: str) -> dict:
+        started = time.time()
+        order = self.order(names)
+
+        with self._lock:
+            pending = [name for name in order if name not in self.builds]
+            for name in pending:
+                self.builds[name] = NodeBuild(name)
+
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="dxforge-build") as executor:
+            with self._finished:
+                while True:
+                    progress = False
+                    for name in list(pending):
+                        dependencies = [self.builds[dependency] for dependency in self.dependencies(name)]
+                        if any(dependency.status in ("failed", "skipped") for dependency in dependencies):
+                            self.builds[name].status = "skipped"
+                            self.builds[name].error = "dependency failed"
+                            self._finished.notify_all()
+                        elif all(dependency.ok for dependency in dependencies):
+                            executor.submit(self._build, self.builds[name])
+                        else:
+                            continue
+                        pending.remove(name)
+                        progress = True
+
+                    if not pending and all(self.builds[name].done for name in order):
+                        break
+                    if not progress:
+                        # until a node is done, built by this call or by another one sharing the session
+                        self._finished.wait()
+
+        return self.report(order, time.time() - started)
+
+    def _build(self, build: NodeBuild):
+        build.status = "building"
+        build.started = time.time()
+        try:
+            build.result = self.controller.nodes[build.name].build(self.controller.docker_client)
+            if errors := build.result.get("errors"):
+                build.status = "failed"
+                build.error = "; ".join(errors.values())
+            else:
+                build.status = "built"
+        except Exception as e:
+            build.status = "failed"
+            build.error = str(e)
+        finally:
+            build.finished = time.time()
+            publish("build.finished", controller=self.controller.name, node=build.name,
+                    status=build.status, duration=build.duration, error=build.error)
+            with self._finished:
+                self._finished.notify_all()
+
+    def critical_path(self, order: list[str]) -> float:
+        finish = {}
+        for name in order:
+            dependencies = self.dependencies(name)
+            finish[name] = self.builds[name].duration + max((finish[d] for d in dependencies), default=0.0)
+        return max(finish.values(), default=0.0)
+
+    def report(self, order: list[str], duration: float) -> dict:
+        return {
+            "nodes": {name: self.builds[name].info for name in order},
+            "duration": duration,
+            "critical_path": self.critical_path(order),
+        }
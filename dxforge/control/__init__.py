@@ -0,0 +1,7 @@
+from .plane import ControlPlane, Job, JobStatus
+from .state import ContainerStateCache, ContainerState
+from .http import HttpPool
+from .logs import stream_logs
+from .stats import StatsSampler, TimeSeries
+from .registry import InstanceRegistry
+from .supervisor import Supervisor
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+from ..utils import SingletonMeta
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class HttpPool(metaclass=SingletonMeta):
+    """Process-wide pooled HTTP client for all traffic from the forge to node interfaces."""
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30,
+                 timeout: float = 10,
+                 http2: bool = False):
+        self.limits = {
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+        }
+        self.timeout = timeout
+        self.http2 = http2
+        self._client: httpx.AsyncClient | None = None
+        self.logger = logging.Logger(__name__)
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'HttpPool':
+        return cls(
+            max_connections=config.get("max_connections", 100),
+            max_keepalive_connections=config.get("max_keepalive_connections", 20),
+            keepalive_expiry=config.get("keepalive_expiry", 30),
+            timeout=config.get("timeout", 10),
+            http2=config.get("http2", False),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self.start()
+        return self._client
+
+    def start(self):
+        if self._client is not None and not self._client.is_closed:
+            return
+        import httpx
+
+        limits = httpx.Limits(**self.limits)
+        try:
+            self._client = httpx.AsyncClient(limits=limits, timeout=self.timeout, http2=self.http2)
+        except ImportError:
+            # http2 needs the optional `h2` package
+            self.logger.warning("http2 requested but h2 is not installed, falling back to HTTP/1.1")
+            self.http2 = False
+            self._client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
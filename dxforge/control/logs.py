@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import AsyncIterator
+
+
+def split_lines(chunks, max_line: int = 64 * 1024):
+    """Re-chunks a byte stream into lines, cutting lines longer than `max_line` so buffers stay bounded."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while (end := buffer.find(b"\n")) != -1 or len(buffer) >= max_line:
+            end = end + 1 if end != -1 else max_line
+            yield bytes(buffer[:end])
+            del buffer[:end]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def stream_logs(instances: dict, prefix: bool = True, queue_size: int = 256, **options) -> AsyncIterator[bytes]:
+    """Streams the logs of several instances as one sequence of lines.
+
+    Each instance is read by its own thread, since docker-py streams are blocking. At most `queue_size` lines
+    are buffered between the readers and the consumer: readers wait for the consumer instead of piling up.
+    Options are passed on to `Container.logs` (tail, since, follow, timestamps).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(queue_size)
+    stop = threading.Event()
+    streams = {}
+    finished = object()
+
+    def put(item) -> bool:
+        while not slots.acquire(timeout=0.5):
+            if stop.is_set():
+                return False
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # the event loop is gone
+            return False
+        return True
+
+    def pump(uuid, instance):
+        label = f"[{uuid[:8]}] ".encode() if prefix else b""
+        try:
+            if (stream := instance.logs(stream=True, **options)) is None:
+                return
+            streams[uuid] = stream
+            for line in split_lines(stream):
+                if stop.is_set() or not put(label + line):
+                    break
+        except Exception as e:
+            put(label + f"error reading logs: {e}\n".encode())
+        finally:
+            put(finished)
+
+    threads = [threading.Thread(target=pump, args=(str(uuid), instance), name="dxforge-logs", daemon=True)
+               for uuid, instance in instances.items()]
+    for thread in threads:
+        thread.start()
+
+    remaining = len(threads)
+    try:
+        while remaining:
+            item = await queue.get()
+            slots.release()
+            if item is finished:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
+        for stream in list(streams.values()):
+            stream.close()
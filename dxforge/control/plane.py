@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from uuid import uuid4
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    # cancelled or timed out, while its thread runs to completion: it can still make changes
+    CANCELLING = "cancelling"
+    CANCELLED = "cancelled"
+    TIMEOUT = "timeout"
+
+
+class Job:
+    def __init__(self, name: str, timeout: float | None = None):
+        self.uuid = str(uuid4())
+        self.name = name
+        self.timeout = timeout
+        self.status = JobStatus.PENDING
+        self.result = None
+        self.error: str | None = None
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def done(self):
+        return self.status not in (JobStatus.PENDING, JobStatus.RUNNING, JobStatus.CANCELLING)
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+    async def wait(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        return self
+
+    def cancel(self):
+        if self.done or self._task is None:
+            return False
+        if self.status == JobStatus.CANCELLING:
+            return True
+        self._task.cancel()
+        if self.status == JobStatus.PENDING:
+            # the task never started, so it will not record its own cancellation
+            self.status = JobStatus.CANCELLED
+            self.finished = time.time()
+        return True
+
+    @property
+    def info(self):
+        return {
+            "uuid": self.uuid,
+            "name": self.name,
+            "status": self.status.value,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "duration": self.duration,
+        }
+
+
+class ControlPlane:
+    """Runs blocking Docker calls on a bounded thread pool so the event loop stays responsive.
+
+    Short operations are awaited directly with `run`, long ones (image builds) are wrapped into
+    pollable `Job`s with `submit`.
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 timeout: float | None = 60,
+                 job_timeout: float | None = None,
+                 max_jobs: int = 256):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dxforge")
+        self.timeout = timeout
+        self.job_timeout = job_timeout
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'ControlPlane':
+        return cls(
+            max_workers=config.get("max_workers", 4),
+            timeout=config.get("timeout", 60),
+            job_timeout=config.get("job_timeout"),
+            max_jobs=config.get("max_jobs", 256),
+        )
+
+    async def run(self, func, *args, timeout: float | None = ..., **kwargs):
+        if timeout is ...:
+            timeout = self.timeout
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    def submit(self, name: str, func, *args, timeout: float | None = ..., **kwargs) -> Job:
+        if timeout is ...:
+            timeout = self.job_timeout
+        job = Job(name, timeout)
+        self.jobs[job.uuid] = job
+        self._evict()
+        job._task = asyncio.get_running_loop().create_task(self._run_job(job, func, *args, **kwargs))
+        return job
+
+    async def _run_job(self, job: Job, func, *args, **kwargs):
+        job.status = JobStatus.RUNNING
+        job.started = time.time()
+        thread = self._executor.submit(functools.partial(func, *args, **kwargs))
+        future = asyncio.wrap_future(thread)
+        try:
+            # shielded, a thread can't be interrupted so cancelling only stops waiting for it
+            job.result = await asyncio.wait_for(asyncio.shield(future), job.timeout)
+            job.status = JobStatus.DONE
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            status = JobStatus.CANCELLED if isinstance(e, asyncio.CancelledError) else JobStatus.TIMEOUT
+            if status == JobStatus.TIMEOUT:
+                job.error = f"job exceeded timeout of {job.timeout}s"
+            # unless it never left the queue, the job is only reported stopped once its thread is,
+            # anything it does until then still lands
+            if not thread.cancel():
+                job.status = JobStatus.CANCELLING
+                try:
+                    job.result = await asyncio.shield(future)
+                except (Exception, asyncio.CancelledError) as e:
+                    job.error = job.error or str(e)
+            job.status = status
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+
+    def _evict(self):
+        # Only finished jobs are dropped, oldest first
+        overflow = len(self.jobs) - self.max_jobs
+        for uuid in [uuid for uuid, job in self.jobs.items() if job.done][:max(overflow, 0)]:
+            del self.jobs[uuid]
+
+    def get_job(self, uuid: str) -> Job | None:
+        return self.jobs.get(uuid)
+
+    async def shutdown(self):
+        for job in self.jobs.values():
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+
+
+class InstanceRegistry:
+    """Durable record of the instances of every node, so a restarted forge can reattach to their containers.
+
+    Backed by SQLite in WAL mode: writes are small and frequent, and reads at boot don't block them.
+    """
+
+    def __init__(self, path: str = "dxforge.db"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS instances (
+                    uuid TEXT PRIMARY KEY,
+                    controller TEXT,
+                    node TEXT,
+                    container TEXT,
+                    image TEXT,
+                    context_hash TEXT,
+                    created REAL,
+                    updated REAL
+                )
+            """)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS instances_node ON instances (controller, node)")
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'InstanceRegistry':
+        return cls(config.get("path", "dxforge.db"))
+
+    def add(self, uuid: str, controller: str, node: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO instances (uuid, controller, node, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (uuid, controller, node, now, now),
+            )
+
+    def update(self, uuid: str, container: str | None, image: str | None, context_hash: str | None):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE instances SET container = ?, image = ?, context_hash = COALESCE(?, context_hash), updated = ?"
+                " WHERE uuid = ?",
+                (container, image, context_hash, time.time(), uuid),
+            )
+
+    def remove(self, uuid: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM instances WHERE uuid = ?", (uuid,))
+
+    def instances(self, controller: str = None) -> list[dict]:
+        query = "SELECT uuid, controller, node, container, image, context_hash, created, updated FROM instances"
+        params = ()
+        if controller is not None:
+            query += " WHERE controller = ?"
+            params = (controller,)
+        with self._lock:
+            cursor = self._connection.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from ..clusters.labels import MANAGED, INSTANCE, CONTROLLER, NODE
+from ..events import publish
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+
+
+@dataclass
+class ContainerState:
+    id: str
+    name: str | None = None
+    instance: str | None = None
+    controller: str | None = None
+    node: str | None = None
+    state: str = "created"
+    ip: str | None = None
+    exit_code: int | None = None
+    restart_count: int = 0
+    updated: float = field(default_factory=time.time)
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    @property
+    def info(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "ip": self.ip,
+            "exit_code": self.exit_code,
+            "restart_count": self.restart_count,
+        }
+
+
+class ContainerStateCache:
+    """In-memory table of managed containers, kept up to date from the Docker events stream.
+
+    Reads never touch the Docker daemon, the listener thread is the only writer. The table is only authoritative
+    while `synced`: from a successful sync until the events stream fails, readers should ask Docker otherwise.
+    """
+    # docker actions that are pushed to event subscribers
+    EVENTS = {
+        "start": "instance.started",
+        "restart": "instance.restarted",
+        "die": "instance.died",
+        "pause": "instance.paused",
+        "unpause": "instance.unpaused",
+        "destroy": "instance.removed",
+    }
+    ACTIONS = {
+        "create": "created",
+        "start": "running",
+        "restart": "running",
+        "unpause": "running",
+        "pause": "paused",
+        "die": "exited",
+        "stop": "exited",
+    }
+
+    def __init__(self, docker_client: DockerClient, max_backoff: float = 30):
+        self.docker_client = docker_client
+        self.max_backoff = max_backoff
+        self._containers: dict[str, ContainerState] = {}
+        self._lock = threading.Lock()
+        self._stream = None
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self._synced = False
+        self.logger = logging.Logger(__name__)
+
+    def get(self, container_id: str) -> ContainerState | None:
+        return self._containers.get(container_id)
+
+    def assign(self, container_id: str, uuid: str):
+        """Binds a container that was created without an instance label, such as a warm pool one."""
+        with self._lock:
+            if not (state := self._containers.get(container_id)):
+                state = self._containers[container_id] = ContainerState(id=container_id)
+            state.instance = str(uuid)
+
+    def containers(self) -> list[ContainerState]:
+        with self._lock:
+            return list(self._containers.values())
+
+    def __len__(self):
+        return len(self._containers)
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def synced(self):
+        # the thread outlives a failing stream while it retries, events may be missing until the next sync
+        return self.alive and self._synced
+
+    def start(self):
+        if self.alive:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._listen, name="dxforge-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._synced = False
+        if self._stream is not None:
+            self._stream.close()
+
+    def _listen(self):
+        backoff = 1
+        while self._running:
+            try:
+                # subscribe before syncing, so nothing that happens during the sync is missed
+                self._stream = self.docker_client.events(
+                    since=int(time.time()),
+                    decode=True,
+                    filters={"type": "container", "label": f"{MANAGED}=true"},
+                )
+                self.sync()
+                backoff = 1
+                for event in self._stream:
+                    self.apply(event)
+            except Exception as e:
+                self.logger.warning(f"Docker events stream failed: {e}")
+            self._synced = False
+            if self._running:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def sync(self):
+        containers = self.docker_client.api.containers(all=True, filters={"label": f"{MANAGED}=true"})
+        states = {}
+        for summary in containers:
+            labels = summary.get("Labels") or {}
+            names = summary.get("Names") or []
+            states[summary["Id"]] = ContainerState(
+                id=summary["Id"],
+                name=names[0].lstrip("/") if names else None,
+                instance=labels.get(INSTANCE),
+                controller=labels.get(CONTROLLER),
+                node=labels.get(NODE),
+                state=summary.get("State", "created"),
+                ip=self._ip(summary.get("NetworkSettings")),
+            )
+        with self._lock:
+            # claimed warm pool containers are still labelled for their pool, their instance only comes from
+            # `assign`, made before this sync or while it listed the containers
+            for container_id, previous in self._containers.items():
+                if (state := states.get(container_id)) is not None and not state.instance:
+                    state.instance = previous.instance
+            self._containers = states
+            self._synced = True
+
+    def apply(self, event: dict):
+        action = event.get("Action", "").split(":")[0]
+        actor = event.get("Actor", {})
+        container_id = event.get("id") or actor.get("ID")
+        attributes = actor.get("Attributes", {})
+
+        if action == "destroy":
+            with self._lock:
+                state = self._containers.pop(container_id, None)
+            if state:
+                self._publish(action, state)
+            return
+
+        with self._lock:
+            if not (state := self._containers.get(container_id)):
+                state = ContainerState(id=container_id,
+                                       name=attributes.get("name"),
+                                       instance=attributes.get(INSTANCE),
+                                       controller=attributes.get(CONTROLLER),
+                                       node=attributes.get(NODE))
+                self._containers[container_id] = state
+
+        if action in ("start", "restart"):
+            # addresses are only assigned once the container is running
+            attrs = self.docker_client.api.inspect_container(container_id)
+            state.ip = self._ip(attrs.get("NetworkSettings"))
+            state.restart_count = attrs.get("RestartCount", state.restart_count)
+            state.exit_code = None
+        elif action == "die":
+            state.exit_code = int(attributes.get("exitCode", 0))
+
+        if new_state := self.ACTIONS.get(action):
+            state.state = new_state
+        state.updated = time.time()
+        self._publish(action, state)
+
+    def _publish(self, action: str, state: ContainerState):
+        # containers waiting in a warm pool don't belong to an instance yet
+        if state.instance and (event := self.EVENTS.get(action)):
+            publish(event, controller=state.controller, node=state.node, instance=state.instance, **state.info)
+
+    @staticmethod
+    def _ip(network_settings: dict | None) -> str | None:
+        if not network_settings:
+            return None
+        if ip := network_settings.get("IPAddress"):
+            return ip
+        for network in (network_settings.get("Networks") or {}).values():
+            if ip := network.get("IPAddress"):
+                return ip
+        return None
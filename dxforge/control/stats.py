@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+    from .state import ContainerStateCache, ContainerState
+
+FIELDS = ("cpu", "memory", "memory_limit", "rx", "tx")
+
+
+class TimeSeries:
+    """Fixed-capacity ring buffer of resource samples, stored in one numpy structured array.
+
+    `cpu` is in percent of one core, `memory` and `memory_limit` in bytes, `rx` and `tx` in bytes per second.
+    """
+
+    def __init__(self, capacity: int = 720):
+        import numpy as np
+
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=[("t", "f8")] + [(name, "f4") for name in FIELDS])
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def append(self, t: float, **values):
+        with self._lock:
+            row = self._data[self._index]
+            row["t"] = t
+            for name in FIELDS:
+                row[name] = values.get(name, 0.0)
+            self._index = (self._index + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def ordered(self):
+        import numpy as np
+
+        with self._lock:
+            if self._count < self.capacity:
+                return self._data[:self._count].copy()
+            return np.concatenate((self._data[self._index:], self._data[:self._index]))
+
+    def query(self, start: float = None, end: float = None, step: float = None) -> dict:
+        """Samples within [start, end], averaged into buckets of `step` seconds if given."""
+        import numpy as np
+
+        data = self.ordered()
+        mask = np.ones(len(data), dtype=bool)
+        if start is not None:
+            mask &= data["t"] >= start
+        if end is not None:
+            mask &= data["t"] <= end
+        data = data[mask]
+
+        if step and len(data):
+            buckets = ((data["t"] - data["t"][0]) // step).astype(np.int64)
+            _, first = np.unique(buckets, return_index=True)
+            counts = np.diff(np.append(first, len(data)))
+            result = {"t": np.add.reduceat(data["t"], first) / counts}
+            for name in FIELDS:
+                result[name] = np.add.reduceat(data[name].astype("f8"), first) / counts
+        else:
+            result = {name: data[name] for name in ("t",) + FIELDS}
+        return {name: values.tolist() for name, values in result.items()}
+
+
+class StatsSampler:
+    """Samples Docker stats of every running managed container in the background, one series per instance."""
+
+    def __init__(self,
+                 docker_client: DockerClient,
+                 state: ContainerStateCache,
+                 interval: float = 5,
+                 capacity: int = 720,
+                 workers: int = 4):
+        self.docker_client = docker_client
+        self.state = state
+        self.interval = interval
+        self.capacity = capacity
+        self.workers = workers
+        self.series: dict[str, TimeSeries] = {}
+        self._previous: dict[str, tuple] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.logger = logging.Logger(__name__)
+
+    @classmethod
+    def from_config(cls, docker_client: DockerClient, state: ContainerStateCache, config: dict) -> 'StatsSampler':
+        return cls(
+            docker_client,
+            state,
+            interval=config.get("interval", 5),
+            capacity=config.get("capacity", 720),
+            workers=config.get("workers", 4),
+        )
+
+    def get(self, uuid: str) -> TimeSeries | None:
+        return self.series.get(str(uuid))
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="dxforge-stats", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dxforge-stats") as executor:
+            while not self._stop.wait(self.interval):
+                containers = [container for container in self.state.containers()
+                              if container.running and container.instance]
+                for container, error in zip(containers, executor.map(self._sample, containers)):
+                    if error:
+                        self.logger.warning(f"Failed sampling stats of {container.name}: {error}")
+                self._prune({container.instance for container in self.state.containers()})
+
+    def _sample(self, container: ContainerState) -> str | None:
+        try:
+            stats = self.docker_client.api.stats(container.id, stream=False, one_shot=True)
+        except Exception as e:
+            return str(e)
+
+        now = time.time()
+        cpu = stats.get("cpu_stats", {})
+        total = cpu.get("cpu_usage", {}).get("total_usage", 0)
+        system = cpu.get("system_cpu_usage", 0)
+        cpus = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or [1])
+        memory = stats.get("memory_stats", {})
+        networks = (stats.get("networks") or {}).values()
+        rx = sum(network.get("rx_bytes", 0) for network in networks)
+        tx = sum(network.get("tx_bytes", 0) for network in networks)
+
+        # one-shot stats carry no previous reading, so rates are computed against our own last sample
+        previous = self._previous.get(container.id)
+        self._previous[container.id] = (now, total, system, rx, tx)
+        if previous is None:
+            return None
+        elapsed = max(now - previous[0], 1e-9)
+        system_delta = system - previous[2]
+
+        if (series := self.series.get(container.instance)) is None:
+            series = self.series[container.instance] = TimeSeries(self.capacity)
+        series.append(
+            now,
+            cpu=(total - previous[1]) / system_delta * cpus * 100 if system_delta > 0 else 0.0,
+            memory=memory.get("usage", 0) - (memory.get("stats") or {}).get("inactive_file", 0),
+            memory_limit=memory.get("limit", 0),
+            rx=(rx - previous[3]) / elapsed,
+            tx=(tx - previous[4]) / elapsed,
+        )
+        return None
+
+    def _prune(self, instances: set[str]):
+        for uuid in [uuid for uuid in self.series if uuid not in instances]:
+            del self.series[uuid]
+        live = {container.id for container in self.state.containers()}
+        for container_id in [container_id for container_id in self._previous if container_id not in live]:
+            del self._previous[container_id]
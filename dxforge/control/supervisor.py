@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from ..events import BUS, publish
+from ..telemetry import instance_recoveries, instance_restarts
+
+
+@dataclass
+class Recovery:
+    restarts: deque = field(default_factory=deque)
+    failed: float | None = None
+    reason: str | None = None
+    probe_failures: int = 0
+    restarting: bool = False
+    crash_loop: str | None = None
+
+    @property
+    def info(self):
+        return {
+            "restarts": len(self.restarts),
+            "failed": self.failed,
+            "reason": self.reason,
+            "crash_loop": self.crash_loop is not None,
+        }
+
+
+class Supervisor:
+    """Watches every running instance and restarts the ones that fail, one at a time.
+
+    Failures are picked up from the Docker events pushed on the event bus as they happen, and by a periodic
+    check that covers missed events and the optional HTTP probe of nodes with a `health` path.
+    Restarts back off exponentially, an instance restarted more than `crash_restarts` times within
+    `crash_window` seconds is left down until it is started again.
+    """
+
+    def __init__(self, orchestrators: list, control_plane, http=None, interval: float = 5,
+                 probe_timeout: float = 2, probe_failures: int = 3, backoff: float = 1, max_backoff: float = 60,
+                 crash_restarts: int = 5, crash_window: float = 300):
+        self.orchestrators = orchestrators
+        self.control_plane = control_plane
+        self.http = http
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.probe_failures = probe_failures
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.crash_restarts = crash_restarts
+        self.crash_window = crash_window
+        self._recoveries: dict[str, Recovery] = {}
+        self._recovered = 0
+        self._recovery_total = 0.0
+        self._recovery_max = 0.0
+        self._tasks: set[asyncio.Task] = set()
+        self.logger = logging.Logger(__name__)
+
+    @classmethod
+    def from_config(cls, orchestrators: list, control_plane, http, config: dict) -> 'Supervisor':
+        return cls(
+            orchestrators,
+            control_plane,
+            http,
+            interval=config.get("interval", 5),
+            probe_timeout=config.get("probe_timeout", 2),
+            probe_failures=config.get("probe_failures", 3),
+            backoff=config.get("backoff", 1),
+            max_backoff=config.get("max_backoff", 60),
+            crash_restarts=config.get("crash_restarts", 5),
+            crash_window=config.get("crash_window", 300),
+        )
+
+    def start(self):
+        if self._tasks:
+            return
+        self._spawn(self._watch())
+        self._spawn(self._check_loop())
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def delay(self, restarts: int) -> float:
+        return min(self.backoff * 2 ** max(restarts - 1, 0), self.max_backoff)
+
+    def nodes(self):
+        """Yields the controller and node of every node of the loaded controllers."""
+        for orchestrator in self.orchestrators:
+            # lazily loaded controllers have no instances until they are loaded
+            controllers = getattr(orchestrator.controllers, "loaded", orchestrator.controllers)
+            for controller in controllers.values():
+                for node in controller.nodes.values():
+                    yield controller, node
+
+    def find(self, controller_name: str, node_name: str):
+        for controller, node in self.nodes():
+            if controller.name == controller_name and node.name == node_name:
+                return controller, node
+        return None, None
+
+    async def _watch(self):
+        subscription = BUS.subscribe()
+        try:
+            while True:
+                event = await subscription.get()
+                if event["type"] != "instance.died":
+                    continue
+                controller, node = self.find(event.get("controller"), event.get("node"))
+                if node is not None and (instance := node.instances.get(event.get("instance"))):
+                    # containers stopped on purpose die too, but are no longer supervised by then
+                    if instance.supervised and instance._container and instance._container.id == event.get("id"):
+                        self.fail(controller, node, instance, f"exited with code {event.get('exit_code')}")
+        finally:
+            BUS.unsubscribe(subscription)
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                self.logger.warning(f"Health check failed: {e}")
+
+    async def check(self):
+        probes = []
+        for controller, node in list(self.nodes()):
+            for instance in list(node.instances.values()):
+                recovery = self._recoveries.get(instance.uuid)
+                if not instance.supervised:
+                    if recovery is not None and not recovery.restarting and recovery.crash_loop is None:
+                        del self._recoveries[instance.uuid]
+                    continue
+                if recovery is not None and recovery.crash_loop is not None:
+                    # started again by hand, which is a fresh start
+                    if instance._container and instance._container.id != recovery.crash_loop:
+                        del self._recoveries[instance.uuid]
+                    continue
+                if not instance.alive:
+                    self.fail(controller, node, instance, "not running")
+                elif node.health and instance.data.ports and self.http is not None:
+                    probes.append(self._probe(controller, node, instance))
+                elif recovery is not None and not recovery.restarting:
+                    self.recovered(controller, node, instance)
+        await asyncio.gather(*probes)
+
+    async def _probe(self, controller, node, instance):
+        url = f"http://{instance.ip}:{instance.data.ports[0]}/{node.health.lstrip('/')}"
+        try:
+            response = await self.http.client.get(url, timeout=self.probe_timeout)
+            healthy = response.status_code < 500
+        except Exception:
+            healthy = False
+
+        recovery = self._recoveries.get(instance.uuid)
+        if healthy:
+            if recovery is not None and not recovery.restarting:
+                recovery.probe_failures = 0
+                self.recovered(controller, node, instance)
+            return
+        if recovery is None:
+            recovery = self._recoveries[instance.uuid] = Recovery()
+        recovery.probe_failures += 1
+        # a few misses in a row, so that an instance that is still booting isn't restarted
+        if recovery.probe_failures >= self.probe_failures:
+            self.fail(controller, node, instance, f"{node.health} failed {recovery.probe_failures} times")
+
+    def fail(self, controller, node, instance, reason: str):
+        if (recovery := self._recoveries.get(instance.uuid)) is None:
+            recovery = self._recoveries[instance.uuid] = Recovery()
+        if recovery.restarting or recovery.crash_loop is not None:
+            return
+        if recovery.failed is None:
+            recovery.failed = time.time()
+        recovery.reason = reason
+        recovery.restarting = True
+        self.logger.warning(f"{controller.name}/{node.name} instance {instance.uuid} failed: {reason}")
+        publish("instance.failed", controller=controller.name, node=node.name, instance=instance.uuid,
+                reason=reason)
+        self._spawn(self._recover(controller, node, instance, recovery))
+
+    async def _recover(self, controller, node, instance, recovery: Recovery):
+        try:
+            while True:
+                now = time.time()
+                while recovery.restarts and recovery.restarts[0] < now - self.crash_window:
+                    recovery.restarts.popleft()
+                if len(recovery.restarts) >= self.crash_restarts:
+                    recovery.crash_loop = instance._container.id if instance._container else ""
+                    self.logger.error(f"{controller.name}/{node.name} instance {instance.uuid} is crash looping, "
+                                      f"{len(recovery.restarts)} restarts in {self.crash_window}s")
+                    publish("instance.crash_loop", controller=controller.name, node=node.name,
+                            instance=instance.uuid, restarts=len(recovery.restarts))
+                    return
+                recovery.restarts.append(now)
+
+                await asyncio.sleep(self.delay(len(recovery.restarts)))
+                if not instance.supervised or node.instances.get(instance.uuid) is not instance:
+                    # stopped or removed in the meantime
+                    return
+                try:
+                    await self.control_plane.run(node.restart, instance.uuid, controller.docker_client)
+                    instance_restarts.inc(controller.name, node.name)
+                    recovery.probe_failures = 0
+                    if not node.health:
+                        self.recovered(controller, node, instance)
+                    return
+                except Exception as e:
+                    self.logger.warning(f"Restarting {controller.name}/{node.name} instance {instance.uuid} "
+                                        f"failed: {e}")
+        finally:
+            recovery.restarting = False
+
+    def recovered(self, controller, node, instance):
+        recovery = self._recoveries.get(instance.uuid)
+        if recovery is None or recovery.failed is None:
+            return
+        duration = time.time() - recovery.failed
+        recovery.failed = None
+        recovery.reason = None
+        instance_recoveries.observe(duration, controller.name, node.name)
+        self._recovered += 1
+        self._recovery_total += duration
+        self._recovery_max = max(self._recovery_max, duration)
+        publish("instance.recovered", controller=controller.name, node=node.name, instance=instance.uuid,
+                duration=duration)
+
+    @property
+    def info(self):
+        return {
+            "instances": {uuid: recovery.info for uuid, recovery in self._recoveries.items()},
+            "recoveries": self._recovered,
+            "mttr": self._recovery_total / self._recovered if self._recovered else None,
+            "max": self._recovery_max if self._recovered else None,
+        }
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+# put in a subscriber queue in place of the events it missed because it fell behind
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, controller: str = None, node: str = None,
+                 maxsize: int = 1000):
+        self.loop = loop
+        self.controller = controller
+        self.node = node
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def matches(self, event: dict) -> bool:
+        if self.controller is not None and event.get("controller") != self.controller:
+            return False
+        if self.node is not None and event.get("node") != self.node:
+            return False
+        return True
+
+    def deliver(self, event: dict):
+        if not self.matches(event):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # the watcher is too slow: drop its backlog, it will have to reload a snapshot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class EventBus:
+    """Fans cluster state changes out to any number of subscribers.
+
+    Events can be published from any thread, they are delivered on the event loop of each subscriber.
+    """
+
+    def __init__(self):
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, controller: str = None, node: str = None) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), controller, node)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, type: str, **fields):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        event = {"type": type, "time": time.time(), **fields}
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # the subscriber's loop is closed
+                self.unsubscribe(subscription)
+
+
+BUS = EventBus()
+
+
+def publish(type: str, **fields):
+    BUS.publish(type, **fields)
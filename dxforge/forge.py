@@ -1,53 +1,234 @@
+import asyncio
+import logging
 from typing import List
 
-import docker
-import httpx
-from docker.errors import APIError
+from .clusters import Orchestrator, Controller, LazyControllers, ResourceScheduler
+from .control import ControlPlane, ContainerStateCache, HttpPool, StatsSampler, InstanceRegistry, Supervisor
+from .telemetry import docker_call
+from .utils import SingletonMeta, Lazy
 
-from .clusters import Orchestrator, Controller
-from .utils import SingletonMeta
+
+def docker_client_factory(base_url: str = None, **kwargs):
+    def factory():
+        import docker
+        if base_url is None:
+            return docker.DockerClient.from_env(**kwargs)
+        return docker.DockerClient(base_url=base_url, **kwargs)
+    return factory
+
+
+def place(controllers: dict, hosts: dict) -> dict:
+    """Assigns every controller to one host: to the host that lists it under `controllers`,
+    otherwise to the host with the fewest controllers so far."""
+    placement = {host: {} for host in hosts}
+    for host, host_config in hosts.items():
+        for name in host_config.get("controllers", []):
+            if name not in controllers:
+                raise ValueError(f"host {host} lists unknown controller {name}")
+            placement[host][name] = controllers[name]
+    placed = {name for assigned in placement.values() for name in assigned}
+    for name, path in controllers.items():
+        if name not in placed:
+            host = min(placement, key=lambda candidate: len(placement[candidate]))
+            placement[host][name] = path
+    return placement
 
 
 class Forge(metaclass=SingletonMeta):
+    network = 'dxforge'
+
     def __init__(self,
-                 orchestrators: List[Orchestrator]):
+                 orchestrators: List[Orchestrator],
+                 control_plane: ControlPlane = None,
+                 http: HttpPool = None,
+                 registry: InstanceRegistry = None,
+                 supervisor: Supervisor = None):
         self._orchestrators = orchestrators
+        self.control_plane = control_plane if control_plane else ControlPlane()
+        self.http = http if http else HttpPool()
+        self.registry = registry
+        self.supervisor = supervisor
+        # in the logging hierarchy, unlike the other dxforge loggers, so shutdown progress reaches the app's handlers
+        self.logger = logging.getLogger(__name__)
 
     @classmethod
     def from_config(cls, config: dict) -> 'Forge':
-        network_name = 'dxforge'
-        network_params = {
-            'driver': 'bridge',
-            'name': network_name
-        }
+        """Builds the forge from its config, with one orchestrator per Docker host under `hosts`
+        (the local daemon if there are none).
+
+        With `startup.lazy` (the default) nothing touches Docker here: clients are created on first use,
+        compose files are parsed when their controller is first accessed, and the network (`ensure_network`)
+        and the state and stats threads (`start`) are left to app startup.
+
+        With a `registry` section, instances are persisted and reattached to their containers by `reattach`,
+        run as a control plane job at startup, and containers outlive the forge unless `shutdown.stop_containers`
+        is set.
+        """
+        lazy = config.get("startup", {}).get("lazy", True)
+        hosts = config.get("hosts") or {"local": {}}
+        placement = place(config.get("controllers", {}), hosts)
+        registry = InstanceRegistry.from_config(config["registry"]) if "registry" in config else None
 
-        docker_client = docker.DockerClient() if docker else None
-        # network = docker_client.networks.create(**network_params)
+        orchestrators = [cls.orchestrator_from_config(host, hosts[host], paths, config, lazy, registry)
+                         for host, paths in placement.items()]
+        control_plane = ControlPlane.from_config(config.get("control", {}))
+        http = HttpPool.from_config(config.get("http", {}))
 
-        try:
-            docker_client.networks.create(**network_params)
-        except APIError:
-            pass
+        supervisor = None
+        if (supervisor_config := config.get("supervisor", {})).get("enabled", True):
+            supervisor = Supervisor.from_config(orchestrators, control_plane, http, supervisor_config)
 
-        controllers = {}
+        forge = cls(orchestrators, control_plane, http, registry, supervisor)
+        if not lazy:
+            forge.ensure_network()
+        return forge
 
-        for name, path in config.get("controllers", {}).items():
-            controllers[name] = Controller.from_file(path, docker_client)
-        orchestrator = Orchestrator(controllers, docker_client)
+    @staticmethod
+    def orchestrator_from_config(name: str, host_config: dict, paths: dict, config: dict, lazy: bool = True,
+                                 registry: InstanceRegistry = None):
+        client_options = {key: host_config[key] for key in ("version", "timeout") if key in host_config}
+        factory = docker_client_factory(host_config.get("base_url"), **client_options)
+        docker_client = Lazy(factory) if lazy else factory()
 
-        return cls([orchestrator])
+        state = ContainerStateCache(docker_client)
+
+        build_parallelism = config.get("control", {}).get("build_parallelism", 4)
+        scheduler = ResourceScheduler.from_config(docker_client, host_config.get("resources", {}))
+
+        def load(controller, path):
+            # only parses the compose file, reattaching to containers is left to `Forge.reattach`
+            return Controller.from_file(path, docker_client, state, build_parallelism, controller, registry,
+                                        scheduler)
+
+        controllers = LazyControllers(paths, load) if lazy else {name: load(name, path) for name, path in paths.items()}
+
+        stats = None
+        if (stats_config := config.get("stats", {})).get("enabled", True):
+            stats = StatsSampler.from_config(docker_client, state, stats_config)
+
+        shutdown = config.get("shutdown", {})
+        return Orchestrator(controllers, docker_client, state, name=name, stats=stats,
+                            parallelism=shutdown.get("parallelism", 8), grace=shutdown.get("grace", 10),
+                            stop_containers=shutdown.get("stop_containers", registry is None),
+                            scheduler=scheduler)
+
+    def start(self):
+        for orchestrator in self._orchestrators:
+            orchestrator.start()
+
+    def ensure_network(self):
+        from docker.errors import APIError
+
+        network_params = {
+            'driver': 'bridge',
+            'name': self.network
+        }
+        for orchestrator in self._orchestrators:
+            try:
+                with docker_call("networks.create"):
+                    orchestrator.docker_client.networks.create(**network_params)
+            except APIError:
+                pass
 
     @property
     def client(self):
-        return httpx.AsyncClient()
+        return self.http.client
+
+    @property
+    def orchestrators(self) -> List[Orchestrator]:
+        return self._orchestrators
 
     @property
     def orchestrator(self):
         return self._orchestrators[0]
 
+    def get_orchestrator(self, controller: str) -> Orchestrator | None:
+        for orchestrator in self._orchestrators:
+            if controller in orchestrator.controllers:
+                return orchestrator
+        return None
+
+    def get_controller(self, controller: str) -> Controller | None:
+        if orchestrator := self.get_orchestrator(controller):
+            return orchestrator.controllers[controller]
+        return None
+
+    async def _gather(self, func) -> tuple[dict, dict]:
+        """Runs `func` on every host at once, returns the results and the errors of the hosts that failed."""
+        results = await asyncio.gather(
+            *[self.control_plane.run(func, orchestrator) for orchestrator in self._orchestrators],
+            return_exceptions=True,
+        )
+        hosts, errors = {}, {}
+        for orchestrator, result in zip(self._orchestrators, results):
+            if isinstance(result, Exception):
+                # timeouts carry no message
+                errors[orchestrator.name] = str(result) or type(result).__name__
+            else:
+                hosts[orchestrator.name] = result
+        return hosts, errors
+
+    async def info(self):
+        hosts, errors = await self._gather(lambda orchestrator: orchestrator.info)
+        return {
+            "hosts": {host: list(info.get("controllers", {})) for host, info in hosts.items()},
+            "resources": {host: info.get("resources") for host, info in hosts.items()},
+            "controllers": {name: controller for info in hosts.values()
+                            for name, controller in info.get("controllers", {}).items()},
+            "errors": errors,
+        }
+
+    async def status(self):
+        hosts, errors = await self._gather(Orchestrator.status)
+        return {
+            "controllers": {name: controller for status in hosts.values() for name, controller in status.items()},
+            "errors": errors,
+        }
+
+    def reattach(self) -> dict:
+        """Loads every controller and reattaches its instances to their containers, blocking on Docker.
+
+        Meant to run as a control plane job, never on the event loop.
+        """
+        attached = {}
+        for orchestrator in self._orchestrators:
+            for name in orchestrator.controllers:
+                controller = orchestrator.controllers[name]
+                if self.registry is not None:
+                    attached[name] = controller.reattach()
+        return attached
+
     async def stop(self):
-        try:
-            self._orchestrators[0].docker_client.networks.get("dxforge").remove()
-        except APIError:
-            pass
-        await self._orchestrators[0].stop()
+        if self.supervisor is not None:
+            # before any container goes down, or it would be restarted
+            await self.supervisor.stop()
+        results = await asyncio.gather(*[self._stop_host(orchestrator) for orchestrator in self._orchestrators],
+                                       return_exceptions=True)
+        for orchestrator, result in zip(self._orchestrators, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"[{orchestrator.name}] shutdown failed: {result!r}")
+        await self.control_plane.shutdown()
+        await self.http.close()
+        if self.registry is not None:
+            self.registry.close()
+
+    async def _stop_host(self, orchestrator: Orchestrator):
+        from docker.errors import APIError
+
+        def remove_network():
+            try:
+                orchestrator.docker_client.networks.get(self.network).remove()
+            except APIError:
+                pass
+
+        def progress(done, total, container, error):
+            if error:
+                self.logger.warning(f"[{orchestrator.name}] {done}/{total} containers stopped: {container} "
+                                    f"failed ({error})")
+            else:
+                self.logger.info(f"[{orchestrator.name}] {done}/{total} containers stopped: {container}")
+
+        # containers go first, a network can't be removed while containers are attached to it
+        await orchestrator.stop(progress)
+        if orchestrator.stop_containers:
+            await asyncio.get_running_loop().run_in_executor(None, remove_network)
@@ -1,4 +1,11 @@
+import logging
 import os
+import time
+
+from dxforge.utils import Startup
+
+# created before the heavier imports, so that import time counts towards time-to-first-request
+startup = Startup()
 
 from dotenv import load_dotenv
 
@@ -8,11 +15,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Depends
 
 from dxforge import Forge
+from dxforge.telemetry import http_requests
 
 
 class App(FastAPI):
     def __init__(self, forge: Forge, origins=None, *args, **kwargs):
-        from dxforge.routers import cluster
+        from dxforge.routers import cluster, jobs, root
 
         super().__init__(*args, **kwargs)
 
@@ -33,14 +41,36 @@ class App(FastAPI):
             allow_headers=["*"],
         )
 
+        @self.middleware("http")
+        async def instrument(request, call_next):
+            start = time.perf_counter()
+            response = await call_next(request)
+            # labelled by route template, so path parameters don't explode the label set
+            route = request.scope.get("route")
+            http_requests.observe(time.perf_counter() - start,
+                                  request.method, route.path if route else "unmatched", str(response.status_code))
+            if "first_request" not in startup.marks:
+                startup.mark("first_request")
+            return response
+
+        self.include_router(root.router, tags=["root"])
         self.include_router(cluster.router, prefix="/cluster", tags=["cluster"])
+        self.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 
 
 def main() -> FastAPI:
     load_dotenv()
+    # dxforge.* loggers report through this handler, third party loggers keep their own level
+    logger = logging.getLogger("dxforge")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
     config_file = os.getenv("CONFIG_FILE", "config.yaml")
     config = yaml.safe_load(open(config_file, "r"))
     forge = Forge.from_config(config)
+    startup.mark("config")
 
     description = """
     The dxforge suite is aimed at small teams and large teams that plan on scaling, 
@@ -69,9 +99,35 @@ def main() -> FastAPI:
     )
 
 
-if __name__ == "__main__":
-    app = main()
+app = main()
+__all__ = ["app"]
+
+startup.mark("app")
+
+
+@app.on_event("startup")
+async def startup_event():
+    forge = Forge()
+    forge.http.start()
+    # the state and stats threads connect to Docker, they only start once the app is up
+    forge.start()
+    # the network is only needed once instances start, so its creation doesn't hold up serving
+    forge.control_plane.submit("ensure network", forge.ensure_network)
+    if forge.supervisor is not None:
+        forge.supervisor.start()
+    if forge.registry is not None:
+        # instances left running by the previous run are reattached in the background
+        forge.control_plane.submit("reattach", forge.reattach)
+    startup.mark("ready")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await Forge().stop()
+    print("Shutting down...")
+
 
+if __name__ == "__main__":
     host = os.getenv("HOST", None)
     port = int(os.getenv("PORT", 8000))
 
@@ -81,12 +137,3 @@ if __name__ == "__main__":
         pass
     finally:
         pass
-else:
-    app = main()
-    __all__ = ["app"]
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    await Forge().stop()
-    print("Shutting down...")
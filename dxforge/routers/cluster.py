@@ -1,16 +1,23 @@
+import asyncio
+import time
 from json import JSONDecodeError
 
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from ..forge import Forge
-from ..clusters import Controller, Node
+from ..clusters import Controller, Node, BuildSession
+from ..control import stream_logs
+from ..events import BUS, RESYNC
 
 router = APIRouter()
 forge = Forge()
 
 
 def get_controller(controller: str) -> Controller:
-    if not (controller := forge.orchestrator.controllers.get(controller, None)):
+    if not (controller := forge.get_controller(controller)):
         raise HTTPException(status_code=404, detail="controller not found")
     return controller
 
@@ -21,9 +28,77 @@ def get_node(controller: Controller, node: str) -> Node:
     return node
 
 
+async def run(func, *args, **kwargs):
+    try:
+        return await forge.control_plane.run(func, *args, **kwargs)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="operation timed out")
+
+
 @router.get("/")
 async def get_info():
-    return forge.orchestrator.info
+    return await forge.info()
+
+
+@router.get("/status")
+async def get_status():
+    return await forge.status()
+
+
+@router.get("/supervisor")
+async def get_supervisor():
+    if forge.supervisor is None:
+        raise HTTPException(status_code=404, detail="Supervisor is disabled")
+    return forge.supervisor.info
+
+
+def snapshot(controller: str = None, node: str = None) -> dict:
+    names = [controller] if controller else [name for orchestrator in forge.orchestrators
+                                             for name in orchestrator.controllers]
+    return {
+        name: {
+            node_name: node_info.info
+            for node_name, node_info in forge.get_controller(name).nodes.items()
+            if node is None or node_name == node
+        }
+        for name in names
+    }
+
+
+@router.websocket("/ws")
+async def websocket_state(websocket: WebSocket,
+                          controller: str = None,
+                          node: str = None):
+    """Sends a snapshot of the cluster on connect, then every state change as it happens."""
+    await websocket.accept()
+    if controller is not None and not forge.get_controller(controller):
+        await websocket.close(code=4404, reason="controller not found")
+        return
+
+    # subscribed before the snapshot is taken, so no change falls in between
+    subscription = BUS.subscribe(controller, node)
+    sender = asyncio.current_task()
+
+    async def receive():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            sender.cancel()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        await websocket.send_json(jsonable_encoder({"type": "snapshot", "state": snapshot(controller, node)}))
+        while True:
+            event = await subscription.get()
+            if event is RESYNC:
+                event = {"type": "snapshot", "state": snapshot(controller, node)}
+            await websocket.send_json(jsonable_encoder(event))
+    except (asyncio.CancelledError, WebSocketDisconnect):
+        pass
+    finally:
+        receiver.cancel()
+        BUS.unsubscribe(subscription)
 
 
 @router.get("/{controller}")
@@ -38,7 +113,9 @@ async def get_controller_info(controller: str):
 async def get_controller_status(controller: str):
     controller = get_controller(controller)
 
-    return controller.status()
+    if controller.state is not None and controller.state.synced:
+        return controller.status()
+    return await run(controller.status)
 
 
 @router.get("/{controller}/node/{node}")
@@ -50,6 +127,52 @@ async def get_node_info(controller: str,
     return node.info
 
 
+# fan-out options for start and stop, see Node._run
+FANOUT_OPTIONS = ("workers", "timeout", "deadline", "fail_fast")
+
+
+def parse_instructions(data: dict) -> tuple[list, dict]:
+    instructions = data.get("instructions", [])
+
+    if not instructions:
+        raise HTTPException(status_code=400, detail="no instructions provided")
+
+    if isinstance(instructions, str):
+        instructions = [instructions]
+
+    options = {key: data[key] for key in FANOUT_OPTIONS if key in data}
+    return instructions, options
+
+
+async def execute_instructions(controller: Controller,
+                               node: Node,
+                               instructions: list,
+                               options: dict,
+                               session: BuildSession = None,
+                               wait: bool = False) -> dict:
+    response = {}
+    if "create" in instructions:
+        status = str(node.create_instance())
+        response['create'] = status
+    if "build" in instructions:
+        # builds are handed back as a pollable job, unless a later instruction needs the image
+        job = forge.control_plane.submit(f"build {controller.name}/{controller.node_name(node)}",
+                                         controller.build_node, node, session)
+        if wait or "start" in instructions:
+            await job.wait()
+        response['build'] = job.info
+    if "start" in instructions:
+        status = await run(controller.start_node, node, **options)
+        response['start'] = status
+    if "stop" in instructions:
+        status = await run(controller.stop_node, node, **options)
+        response['stop'] = status
+    # if response is empty, no valid instructions were provided
+    if not response:
+        raise HTTPException(status_code=400, detail="invalid instruction")
+    return response
+
+
 @router.post("/{controller}/node/{node}")
 async def post_node_instruction(request: Request,
                                 controller: str,
@@ -62,31 +185,10 @@ async def post_node_instruction(request: Request,
     except JSONDecodeError:
         raise HTTPException(status_code=400, detail="invalid instruction or no body provided")
 
-    instructions = data.get("instructions", [])
-
-    if not instructions:
-        raise HTTPException(status_code=400, detail="no instructions provided")
-
-    if isinstance(instructions, str):
-        instructions = [instructions]
+    instructions, options = parse_instructions(data)
 
     try:
-        response = {}
-        if "create" in instructions:
-            status = str(node.create_instance())
-            response['create'] = status
-        if "build" in instructions:
-            status = controller.build_node(node)
-            response['build'] = status
-        if "start" in instructions:
-            status = controller.start_node(node)
-            response['start'] = status
-        if "stop" in instructions:
-            status = controller.stop_node(node)
-            response['stop'] = status
-        # if response is empty, no valid instructions were provided
-        if not response:
-            raise HTTPException(status_code=400, detail="invalid instruction")
+        response = await execute_instructions(controller, node, instructions, options)
 
     except HTTPException as e:
         raise e
@@ -95,3 +197,216 @@ async def post_node_instruction(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
     return response
+
+
+def failure(response: dict) -> str | None:
+    if build := response.get("build"):
+        if build["status"] != "done":
+            return build["error"] or f"build {build['status']}"
+        failed = [name for name, report in build["result"]["nodes"].items() if report["status"] != "built"]
+        if failed:
+            return f"build failed for {', '.join(failed)}"
+    # a node that didn't come up on every instance fails the operations depending on it
+    for instruction in ("start", "stop"):
+        if errors := (response.get(instruction) or {}).get("errors"):
+            return f"{instruction} failed for {', '.join(f'{uuid} ({error})' for uuid, error in errors.items())}"
+    return None
+
+
+@router.post("/batch")
+async def post_batch(request: Request):
+    """Runs instructions on many nodes in one call.
+
+    Operations run concurrently, except that an operation waits for the operations on the nodes its node
+    depends on, and for earlier operations on the same node. Builds share one session per controller.
+    """
+    started = time.time()
+    try:
+        data = await request.json()
+    except JSONDecodeError:
+        raise HTTPException(status_code=400, detail="invalid body or no body provided")
+
+    if not isinstance(operations := data.get("operations"), list) or not operations:
+        raise HTTPException(status_code=400, detail="no operations provided")
+
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise HTTPException(status_code=400, detail="operations must be objects")
+        controller = get_controller(operation.get("controller"))
+        node = get_node(controller, operation.get("node"))
+        parsed.append((controller, controller.node_name(node), *parse_instructions(operation)))
+
+    sessions = {}
+    for controller, *_ in parsed:
+        sessions.setdefault(controller.name, controller.build_session())
+
+    dependencies = []
+    for i, (controller, name, *_) in enumerate(parsed):
+        closure = set(sessions[controller.name].order([name])) - {name}
+        dependencies.append([
+            j for j, (other, other_name, *_) in enumerate(parsed)
+            if other is controller and (other_name in closure or (other_name == name and j < i))
+        ])
+
+    tasks = []
+
+    async def execute(i):
+        controller, name, instructions, options = parsed[i]
+        result = {"controller": controller.name, "node": name}
+        for j in dependencies[i]:
+            if (await tasks[j])["status"] != "done":
+                return {**result, "status": "skipped", "error": "dependency failed"}
+        try:
+            response = await execute_instructions(controller, controller.nodes[name], instructions, options,
+                                                  sessions[controller.name], wait=True)
+        except HTTPException as e:
+            return {**result, "status": "failed", "error": e.detail}
+        except Exception as e:
+            return {**result, "status": "failed", "error": str(e)}
+        if error := failure(response):
+            return {**result, "status": "failed", "error": error, "result": response}
+        return {**result, "status": "done", "result": response}
+
+    tasks.extend(asyncio.ensure_future(execute(i)) for i in range(len(parsed)))
+    results = await asyncio.gather(*tasks)
+
+    return {
+        "results": results,
+        "failed": sum(result["status"] != "done" for result in results),
+        "duration": time.time() - started,
+    }
+
+
+@router.put("/{controller}/node/{node}/replicas")
+async def put_node_replicas(request: Request,
+                            controller: str,
+                            node: str):
+    job_name = f"scale {controller}/{node}"
+    controller = get_controller(controller)
+    node = get_node(controller, node)
+
+    try:
+        data = await request.json()
+    except JSONDecodeError:
+        raise HTTPException(status_code=400, detail="invalid body or no body provided")
+
+    replicas = data.get("replicas")
+    if not isinstance(replicas, int) or replicas < 0:
+        raise HTTPException(status_code=400, detail="replicas must be a non-negative integer")
+
+    options = {key: data[key] for key in FANOUT_OPTIONS if key in data}
+    job = forge.control_plane.submit(job_name, controller.scale_node, node, replicas, **options)
+    if data.get("wait", True):
+        await job.wait()
+    return job.info
+
+
+@router.get("/{controller}/node/{node}/logs")
+async def get_node_logs(controller: str,
+                        node: str,
+                        instance: str = None,
+                        tail: int = None,
+                        since: int = None,
+                        follow: bool = False,
+                        timestamps: bool = False):
+    controller = get_controller(controller)
+    node = get_node(controller, node)
+
+    if instance is None:
+        instances = dict(node.instances)
+    elif instance in node.instances:
+        instances = {instance: node.instances[instance]}
+    else:
+        raise HTTPException(status_code=404, detail="instance not found")
+
+    options = {"follow": follow, "timestamps": timestamps, "tail": tail if tail is not None else "all"}
+    if since is not None:
+        options["since"] = since
+
+    return StreamingResponse(stream_logs(instances, prefix=instance is None, **options), media_type="text/plain")
+
+
+@router.get("/{controller}/node/{node}/metrics")
+async def get_node_metrics(controller: str,
+                           node: str,
+                           instance: str = None,
+                           start: float = None,
+                           end: float = None,
+                           step: float = None):
+    orchestrator = forge.get_orchestrator(controller)
+    controller = get_controller(controller)
+    node = get_node(controller, node)
+
+    if (stats := orchestrator.stats) is None:
+        raise HTTPException(status_code=404, detail="stats sampling is disabled")
+    if instance is not None and instance not in node.instances:
+        raise HTTPException(status_code=404, detail="instance not found")
+
+    metrics = {}
+    for uuid in [instance] if instance is not None else list(node.instances):
+        if (series := stats.get(uuid)) is not None:
+            metrics[uuid] = series.query(start, end, step)
+    return metrics
+
+
+# headers that only apply to a single connection and must not be forwarded
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host",
+}
+
+
+def forward_headers(items) -> list[tuple[str, str]]:
+    # pairs rather than a mapping, repeated headers such as set-cookie must stay separate
+    return [(key, value) for key, value in items if key.lower() not in HOP_HEADERS]
+
+
+@router.api_route("/{controller}/node/{node}/proxy/{path:path}",
+                  methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
+async def proxy_node(request: Request,
+                     controller: str,
+                     node: str,
+                     path: str):
+    controller = get_controller(controller)
+    node = get_node(controller, node)
+
+    if (uuid := node.pick_instance()) is None:
+        raise HTTPException(status_code=503, detail="no healthy instance available")
+    try:
+        port, host = node.get_interface(uuid)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    import httpx
+
+    client = forge.client
+    upstream = client.build_request(
+        request.method,
+        f"http://{host}:{port}/{path}",
+        params=request.query_params,
+        # starlette lists repeated headers one by one
+        headers=forward_headers(request.headers.items()),
+        content=request.stream(),
+    )
+
+    node.balancer.acquire(uuid)
+    try:
+        response = await client.send(upstream, stream=True)
+    except httpx.HTTPError as e:
+        node.balancer.release(uuid)
+        raise HTTPException(status_code=502, detail=f"upstream error: {e}")
+
+    async def close():
+        await response.aclose()
+        node.balancer.release(uuid)
+
+    streaming = StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        background=BackgroundTask(close),
+    )
+    # httpx joins repeated headers with commas in items(), which breaks cookies
+    for key, value in forward_headers(response.headers.multi_items()):
+        streaming.headers.append(key, value)
+    return streaming
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+
+from ..forge import Forge
+
+router = APIRouter()
+forge = Forge()
+
+
+@router.get("/")
+async def get_jobs():
+    return [job.info for job in forge.control_plane.jobs.values()]
+
+
+@router.get("/{job}")
+async def get_job(job: str):
+    if not (job := forge.control_plane.get_job(job)):
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.info
+
+
+@router.delete("/{job}")
+async def cancel_job(job: str):
+    if not (job := forge.control_plane.get_job(job)):
+        raise HTTPException(status_code=404, detail="job not found")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail="job already finished")
+    return job.info
@@ -1,5 +1,20 @@
-# from fastapi import APIRouter
-# from ..forge import Forge
-#
-# router = APIRouter()
-# forge = Forge()
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..telemetry import REGISTRY
+from ..utils import Startup
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def get_health():
+    return {
+        "status": "ok",
+        "startup": Startup().report,
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
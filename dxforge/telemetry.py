@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """Latency histogram with fixed buckets; observing is a bisect and three increments under a lock."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if (entry := self._values.get(labels)) is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [(labels, list(entry[0]), entry[1], entry[2]) for labels, entry in self._values.items()]
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Histogram] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.register(Histogram(
+    "dxforge_http_request_duration_seconds", "Latency of forge API requests.", ("method", "route", "status")))
+docker_calls = REGISTRY.register(Histogram(
+    "dxforge_docker_call_duration_seconds", "Latency of Docker SDK calls made by the forge.", ("operation",)))
+instance_starts = REGISTRY.register(Histogram(
+    "dxforge_instance_start_seconds", "Time to start an instance, from a warm pool or cold.", ("image", "source")))
+instance_recoveries = REGISTRY.register(Histogram(
+    "dxforge_instance_recovery_seconds", "Time from an instance failing to it being healthy again.",
+    ("controller", "node")))
+instance_restarts = REGISTRY.register(Counter(
+    "dxforge_instance_restarts_total", "Instances restarted by the supervisor.", ("controller", "node")))
+docker_errors = REGISTRY.register(Counter(
+    "dxforge_docker_call_errors_total", "Docker SDK calls that raised.", ("operation",)))
+
+
+@contextmanager
+def docker_call(operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        docker_errors.inc(operation)
+        raise
+    finally:
+        docker_calls.observe(time.perf_counter() - start, operation)
@@ -1,3 +1,8 @@
+import logging
+import threading
+import time
+
+
 class SingletonMeta(type):
     _instances = {}
 
@@ -6,3 +11,45 @@ class SingletonMeta(type):
             instance = super().__call__(*args, **kwargs)
             cls._instances[cls] = instance
         return cls._instances[cls]
+
+
+class Lazy:
+    """Proxy that creates the wrapped object on first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self):
+        return self._instance is not None
+
+    @property
+    def instance(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.instance, name)
+
+
+class Startup(metaclass=SingletonMeta):
+    """Wall-clock milestones of the forge process, relative to its creation."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.marks: dict[str, float] = {}
+
+    def mark(self, name: str, once: bool = True):
+        if once and name in self.marks:
+            return
+        self.marks[name] = time.time() - self.started
+        logging.getLogger("dxforge").info(f"startup: {name} after {self.marks[name]:.3f}s")
+
+    @property
+    def report(self):
+        return {"started": self.started, **self.marks}